@@ -1,19 +1,60 @@
+# Patch the standard library before anything else imports it, so blocking socket
+# I/O (httplib2 for Google Sheets, pymongo) and threading primitives cooperate with
+# the eventlet hub Socket.IO runs on instead of stalling every connected client.
+# Only when run as the server: by the time the flask CLI, a test runner or a WSGI
+# server imports this module, threading is already loaded and patching it would
+# fail. Servers that import the app (e.g. gunicorn -k eventlet) patch it themselves.
+import eventlet
+if __name__ == '__main__':
+    eventlet.monkey_patch()
+
 import os
-from math import radians, cos, sin, sqrt, atan2
+from math import radians, cos, sin, sqrt, atan2, isfinite, log
 import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import logging
+import threading
+import time
+import heapq
+import sqlite3
+import csv
+import io
+import tempfile
+import uuid
+import hashlib
+import random
+import queue
+import atexit
+import signal
+import sys
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+from email.utils import parsedate_to_datetime
 
-from flask import Flask, jsonify, request, send_from_directory, render_template
+import click
+from flask import Flask, jsonify, request, send_from_directory, render_template, Response, g, has_request_context
 from flask_cors import CORS
 import pandas as pd
+import numpy as np
 from google.oauth2.credentials import Credentials
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from google.auth.exceptions import TransportError
+import httplib2
 from flask_socketio import SocketIO, join_room, leave_room, emit
-from pymongo import MongoClient
-import eventlet
+from socketio import PubSubManager, RedisManager, KafkaManager, ZmqManager, KombuManager
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from bson.errors import InvalidId
+
+try:  # Optional, only needed for parquet exports
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -26,6 +67,8 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DB_PATH = os.path.join(BASE_DIR, "people.db")
 
 DATABASE_URL = f"sqlite:///{DB_PATH}"
+# Local server state (ID allocation etc.), kept out of the legacy people.db
+STATE_DB_PATH = os.environ.get('STATE_DB_PATH', os.path.join(BASE_DIR, "app_state.db"))
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 # Enable CORS for all origins in development
@@ -44,15 +87,281 @@ SCOPES = [
 ]
 SPREADSHEET_ID = '1jWZ6KOfsXWXxtZzrZg2rUEe9qDlOOTsdanWTt3q4rqc'
 RANGE_NAME = 'Sheet1!A2:I'  # Updated to include organization and role
+APPEND_RANGE = 'Sheet1!A:I'  # The append API finds the end of the table itself
+ID_RANGE_NAME = 'Sheet1!A2:A'
+
+# Write-behind queue for sheet appends
+SHEET_WRITE_BATCH_SIZE = int(os.environ.get('SHEET_WRITE_BATCH_SIZE', 500))  # rows per append call
+SHEET_FLUSH_INTERVAL = float(os.environ.get('SHEET_FLUSH_INTERVAL', 1.0))  # seconds between queue checks
+SHEET_RETRY_MAX_DELAY = float(os.environ.get('SHEET_RETRY_MAX_DELAY', 300))
+# Failed flushes a queued write gets before it is moved to the dead-letter table
+SHEET_MAX_ATTEMPTS = int(os.environ.get('SHEET_MAX_ATTEMPTS', 20))
+SHEETS_CELL_MAX_CHARS = 50000  # the Sheets API rejects longer cell values
+
+# Bulk import
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))  # rows validated and queued at a time
+IMPORT_JOBS_KEPT = 100  # finished import jobs remembered for status polling
+
+# Bulk export
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))  # rows per streamed chunk / parquet row group
+EXPORT_FIELDS = ['id', 'name', 'photo_url', 'phone', 'email', 'latitude', 'longitude', 'organization', 'role']
+
+# Client-side limits for the Sheets API (the default quota is 60 requests per minute per user)
+SHEETS_REQUESTS_PER_MINUTE = float(os.environ.get('SHEETS_REQUESTS_PER_MINUTE', 60))
+SHEETS_BURST = float(os.environ.get('SHEETS_BURST', 10))
+SHEETS_MAX_RETRIES = int(os.environ.get('SHEETS_MAX_RETRIES', 5))
+SHEETS_BACKOFF_BASE = float(os.environ.get('SHEETS_BACKOFF_BASE', 0.5))  # seconds
+SHEETS_BACKOFF_MAX = float(os.environ.get('SHEETS_BACKOFF_MAX', 32))  # seconds
+SHEETS_BREAKER_THRESHOLD = int(os.environ.get('SHEETS_BREAKER_THRESHOLD', 5))
+SHEETS_BREAKER_RESET = float(os.environ.get('SHEETS_BREAKER_RESET', 30))  # seconds
+
+# Directory snapshot configuration
+PEOPLE_CACHE_TTL = float(os.environ.get('PEOPLE_CACHE_TTL', 30))  # seconds between sheet re-reads
+# Geohash precision used to snap /api/nearby query points; 0 disables the cell cache
+NEARBY_GEOHASH_PRECISION = int(os.environ.get('NEARBY_GEOHASH_PRECISION', 0))
+NEARBY_CACHE_SIZE = int(os.environ.get('NEARBY_CACHE_SIZE', 1024))
+# Put a Bloom filter in front of the email index so most unknown emails are rejected without a dict lookup
+EMAIL_BLOOM_FILTER = os.environ.get('EMAIL_BLOOM_FILTER', '').lower() in ('1', 'true', 'yes')
+PROFILE_CHECK_BATCH_MAX = 1000  # emails per /api/check_profile_exists call
+NEARBY_BATCH_MAX = int(os.environ.get('NEARBY_BATCH_MAX', 1000))  # queries per /api/nearby/batch call
+GEO_GRID_CELL_DEG = float(os.environ.get('GEO_GRID_CELL_DEG', 0.5))  # grid index cell size for streamed nearby queries
+
+# Chat history pagination
+CHAT_HISTORY_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_PAGE_SIZE', 50))  # default ?limit=
+CHAT_HISTORY_MAX_PAGE = 500
+# Recent messages kept in memory per room, for history pages and reconnect catch-up
+ROOM_BUFFER_SIZE = int(os.environ.get('ROOM_BUFFER_SIZE', 100))
+ROOM_CACHE_MAX_BYTES = int(os.environ.get('ROOM_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Background persistence of chat messages
+MESSAGE_BATCH_SIZE = int(os.environ.get('MESSAGE_BATCH_SIZE', 100))  # messages per insert_many
+MESSAGE_FLUSH_INTERVAL = float(os.environ.get('MESSAGE_FLUSH_INTERVAL', 0.05))  # seconds a batch may wait to fill
+MESSAGE_QUEUE_MAX = int(os.environ.get('MESSAGE_QUEUE_MAX', 10000))
+MESSAGE_RETRY_MAX_DELAY = 30  # seconds
+# (sender, client_msg_id) pairs remembered in memory to reject resent messages without Mongo
+RECENT_MESSAGE_IDS = int(os.environ.get('RECENT_MESSAGE_IDS', 10000))
+CLIENT_MSG_ID_MAX_LENGTH = 128
+
+# Message queue shared by Socket.IO workers, e.g. redis://localhost:6379/0 or
+# sqlite:///socketio_pubsub.db for several workers on one machine; unset means a single worker
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'people-chat')
+SQLITE_PUBSUB_POLL_INTERVAL = float(os.environ.get('SQLITE_PUBSUB_POLL_INTERVAL', 0.02))  # seconds
+SQLITE_PUBSUB_RETENTION = 60  # seconds a published message is kept for slow listeners
+
+# -------------------------------------------------
+# Socket.IO message queue backends
+# -------------------------------------------------
+
+MESSAGE_QUEUE_BACKENDS = {}
+
+def register_message_queue(*schemes):
+    """Register a client manager factory for the given SOCKETIO_MESSAGE_QUEUE URL schemes.
+
+    A factory takes (url, channel) and returns a python-socketio client manager.
+    """
+    def register(factory):
+        for scheme in schemes:
+            MESSAGE_QUEUE_BACKENDS[scheme] = factory
+        return factory
+    return register
+
+class RoomCacheFeed:
+    """Client manager mixin: messages emitted by other workers also land in this worker's room cache.
+
+    Without it a worker's room buffers would only hold messages sent through that
+    worker, and history or catch-up served from them would silently miss the rest.
+    """
+
+    def _handle_emit(self, message):
+        if message.get('host_id') != self.host_id and message.get('event') == 'receive_message':
+            for payload in message.get('data') or []:
+                remember_remote_message(message.get('room'), payload)
+        return super()._handle_emit(message)
+
+class SqlitePubSubManager(RoomCacheFeed, PubSubManager):
+    """Socket.IO pub/sub over a shared SQLite file, for several workers on one host.
+
+    Publishing appends a row; every worker polls for rows past the last one it saw.
+    Needs nothing but the filesystem, at the cost of SQLITE_PUBSUB_POLL_INTERVAL of
+    extra latency between workers.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        # sqlite:///relative/to/app.db or sqlite:////absolute/path.db
+        path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else ''
+        self.path = os.path.join(BASE_DIR, path or 'socketio_pubsub.db')
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS pubsub (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                channel TEXT NOT NULL,
+                                payload TEXT NOT NULL,
+                                created_at REAL NOT NULL)""")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _publish(self, data):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO pubsub (channel, payload, created_at) VALUES (?, ?, ?)",
+                         (self.channel, json.dumps(data), time.time()))
+
+    def _listen(self):
+        conn = self._connect()
+        (last_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM pubsub").fetchone()
+        next_cleanup = time.monotonic() + SQLITE_PUBSUB_RETENTION
+        while True:
+            rows = conn.execute("SELECT id, payload FROM pubsub WHERE id > ? AND channel = ? ORDER BY id LIMIT 500",
+                                (last_id, self.channel)).fetchall()
+            for row_id, payload in rows:
+                last_id = row_id
+                yield json.loads(payload)
+            if time.monotonic() >= next_cleanup:
+                with conn:
+                    conn.execute("DELETE FROM pubsub WHERE created_at < ?", (time.time() - SQLITE_PUBSUB_RETENTION,))
+                next_cleanup = time.monotonic() + SQLITE_PUBSUB_RETENTION
+            if not rows:
+                time.sleep(SQLITE_PUBSUB_POLL_INTERVAL)
+
+register_message_queue('sqlite')(SqlitePubSubManager)
+
+def _library_backend(manager_class):
+    # python-socketio's own managers, with the room cache feed mixed in
+    cls = type(manager_class.__name__, (RoomCacheFeed, manager_class), {})
+    return lambda url, channel: cls(url, channel=channel)
+
+register_message_queue('redis', 'rediss')(_library_backend(RedisManager))
+register_message_queue('kafka')(_library_backend(KafkaManager))
+register_message_queue('zmq+tcp', 'zmq+ipc')(_library_backend(ZmqManager))
+register_message_queue('amqp', 'amqps', 'kombu')(_library_backend(KombuManager))
+
+def make_client_manager(url):
+    """Client manager for SOCKETIO_MESSAGE_QUEUE, or None to keep rooms in this process."""
+    if not url:
+        return None
+    scheme = url.split(':', 1)[0]
+    factory = MESSAGE_QUEUE_BACKENDS.get(scheme)
+    if factory is None:
+        raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE scheme: {scheme}")
+    logger.info(f"Using {scheme} message queue for Socket.IO")
+    return factory(url, SOCKETIO_CHANNEL)
 
 # Flask-SocketIO setup
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+_client_manager = make_client_manager(SOCKETIO_MESSAGE_QUEUE)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet',
+                    **({'client_manager': _client_manager} if _client_manager else {}))
 
 # MongoDB setup
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client['people_chat']
-messages_collection = db['messages']
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000))  # waiting for a free pooled connection
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 20000))
+# Chat message storage: 'mongo', or 'sqlite' for deployments without a Mongo server
+MESSAGE_STORE = os.environ.get('MESSAGE_STORE', 'mongo').lower()
+MESSAGE_DB_PATH = os.environ.get('MESSAGE_DB_PATH', os.path.join(BASE_DIR, "messages.db"))
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters for /api/stats: connections in use and time spent waiting for one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connections = 0
+
+    def _waited(self, event):
+        # duration is only reported by pymongo 4.7+
+        waited = getattr(event, 'duration', None) or 0.0
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            self.checkouts += 1
+            self._waited(event)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            self._waited(event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': self.connections,
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'max_pool_size': MONGO_MAX_POOL_SIZE,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'avg_wait_ms': round(1000 * self.wait_seconds / self.checkouts, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(1000 * self.max_wait_seconds, 3),
+            }
+
+mongo_pool_metrics = MongoPoolMetrics()
+_mongo_client = None
+_mongo_client_lock = threading.Lock()
+
+def get_mongo_client():
+    """The shared MongoClient, created on first use so importing app.py stays cheap."""
+    global _mongo_client
+    if _mongo_client is None:
+        with _mongo_client_lock:
+            if _mongo_client is None:
+                logger.info(f"Connecting to MongoDB (pool size {MONGO_MIN_POOL_SIZE}-{MONGO_MAX_POOL_SIZE})")
+                _mongo_client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                    event_listeners=[mongo_pool_metrics],
+                )
+    return _mongo_client
 
 def get_google_sheets_service():
     """Get Google Sheets service object."""
@@ -79,7 +388,231 @@ def get_google_sheets_service():
         logger.error(f"Error setting up Google Sheets service: {str(e)}")
         return None
 
-def fetch_people_data():
+# -------------------------------------------------
+# Sheets API rate limiting and retries
+# -------------------------------------------------
+
+# Lower numbers go first when the limiter is short of tokens
+PRIORITY_WRITE = 0       # flushing user submissions
+PRIORITY_READ = 1        # a request is waiting on the sheet
+PRIORITY_BACKGROUND = 2  # background snapshot refreshes
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Network failures below the HTTP layer: sockets, httplib2 (e.g. DNS) and google-auth token requests
+TRANSPORT_ERRORS = (OSError, httplib2.HttpLib2Error, TransportError)
+
+class SheetsRateLimiter:
+    """Token bucket shared by every Sheets API call in this process.
+
+    Callers wait for a token instead of spending quota on requests that would be
+    answered with 429. While a higher-priority caller is waiting, lower-priority
+    ones hold back, so background refreshes yield to user-facing writes.
+    """
+
+    def __init__(self, requests_per_minute, burst):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._waiting = [0, 0, 0]
+        self.throttled = 0
+        self.throttle_wait_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority):
+        start = time.monotonic()
+        waited = False
+        with self._lock:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                with self._lock:
+                    self._refill()
+                    outranked = any(self._waiting[p] for p in range(priority))
+                    if not outranked and self.tokens >= 1:
+                        self.tokens -= 1
+                        break
+                    delay = max((1 - self.tokens) / self.rate, 0.05)
+                waited = True
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self._waiting[priority] -= 1
+        if waited:
+            self.throttled += 1
+            self.throttle_wait_seconds += time.monotonic() - start
+
+class SheetsUnavailable(Exception):
+    """Raised instead of calling the Sheets API while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """Stops calling the Sheets API after repeated failures.
+
+    After `threshold` consecutive failures the breaker opens and calls fail fast
+    with SheetsUnavailable. Once `reset_timeout` has passed it goes half-open and
+    lets a single probe through: success closes it again, failure re-opens it.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.rejected = 0
+
+    def _probe_due(self):
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and self._probe_due():
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self):
+        """True while calls would be rejected without reaching the API."""
+        with self._lock:
+            if self.state == 'open':
+                return not self._probe_due()
+            return self.state == 'half_open' and self._probing
+
+    def retry_in(self):
+        with self._lock:
+            if self.state != 'open':
+                return 0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("Sheets API recovered, closing circuit breaker")
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.threshold):
+                if self.state == 'closed':
+                    self.trips += 1
+                    logger.warning(f"Sheets API failed {self.failures} times in a row, opening circuit breaker")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'trips': self.trips,
+            'rejected': self.rejected,
+            'retry_in_seconds': round(self.retry_in(), 3),
+        }
+
+sheets_limiter = SheetsRateLimiter(SHEETS_REQUESTS_PER_MINUTE, SHEETS_BURST)
+sheets_breaker = CircuitBreaker(SHEETS_BREAKER_THRESHOLD, SHEETS_BREAKER_RESET)
+sheets_stats = {'calls': 0, 'retries': 0, 'errors': 0}
+
+def retry_after_seconds(value):
+    """Seconds to wait according to a Retry-After header, which may be a number or an HTTP-date."""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring unparseable Retry-After header: {value!r}")
+        return 0.0
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+def execute_sheets_request(make_request, priority):
+    """Execute a Sheets API request under the rate limiter.
+
+    make_request builds the request (e.g. a lambda around service.spreadsheets()...);
+    429/5xx responses and network errors are retried with full-jitter exponential
+    backoff, honouring Retry-After when the API sends one. Raises SheetsUnavailable
+    without touching the API while the circuit breaker is open.
+    """
+    for attempt in range(SHEETS_MAX_RETRIES + 1):
+        if not sheets_breaker.allow():
+            raise SheetsUnavailable(f"Sheets API circuit open, retrying in {sheets_breaker.retry_in():.0f}s")
+        retry_after = 0
+        answered = False
+        try:
+            sheets_limiter.acquire(priority)
+            sheets_stats['calls'] += 1
+            result = make_request().execute()
+            answered = True
+            return result
+        except HttpError as err:
+            if err.resp.status not in RETRYABLE_STATUSES:
+                # The API answered; a 4xx says nothing about its availability
+                answered = True
+                sheets_stats['errors'] += 1
+                raise
+            if attempt == SHEETS_MAX_RETRIES:
+                sheets_stats['errors'] += 1
+                raise
+            retry_after = retry_after_seconds(err.resp.get('retry-after'))
+            logger.warning(f"Sheets API returned {err.resp.status}, retrying (attempt {attempt + 1})")
+        except TRANSPORT_ERRORS as e:
+            if attempt == SHEETS_MAX_RETRIES:
+                sheets_stats['errors'] += 1
+                raise
+            logger.warning(f"Sheets API network error, retrying (attempt {attempt + 1}): {str(e)}")
+        except Exception:
+            # Not retried (e.g. a credentials refresh that was refused), but still a failure
+            sheets_stats['errors'] += 1
+            raise
+        finally:
+            # Settle every call with the breaker, or a failed half-open probe would
+            # leave it rejecting calls until the process restarts
+            if answered:
+                sheets_breaker.record_success()
+            else:
+                sheets_breaker.record_failure()
+        sheets_stats['retries'] += 1
+        time.sleep(max(retry_after, random.uniform(0, min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * 2 ** attempt))))
+
+def parse_person_row(row):
+    """Convert a sheet row (list of cell values) into a person dict."""
+    # Pad row with None values if it's too short
+    row_padded = row + [None] * (9 - len(row))  # Updated for new columns
+    return {
+        'id': row_padded[0],
+        'name': row_padded[1],
+        'photo_url': row_padded[2],
+        'phone': row_padded[3],
+        'email': row_padded[4],
+        'latitude': float(row_padded[5]) if row_padded[5] else None,
+        'longitude': float(row_padded[6]) if row_padded[6] else None,
+        'organization': row_padded[7],  # New field
+        'role': row_padded[8],  # New field
+    }
+
+def fetch_people_data(priority=PRIORITY_READ):
     logger.info("fetch_people_data: start")
     try:
         service = get_google_sheets_service()
@@ -88,8 +621,8 @@ def fetch_people_data():
             return []
         logger.info(f"Fetching data from spreadsheet {SPREADSHEET_ID}")
         sheet = service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=SPREADSHEET_ID,
-                                  range=RANGE_NAME).execute()
+        result = execute_sheets_request(
+            lambda: sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME), priority)
         values = result.get('values', [])
         logger.info(f"fetch_people_data: got {len(values)} rows")
         if not values:
@@ -99,26 +632,16 @@ def fetch_people_data():
         # Convert to list of dictionaries
         people = []
         for row in values:
-            # Pad row with None values if it's too short
-            row_padded = row + [None] * (9 - len(row))  # Updated for new columns
             try:
-                person = {
-                    'id': row_padded[0],
-                    'name': row_padded[1],
-                    'photo_url': row_padded[2],
-                    'phone': row_padded[3],
-                    'email': row_padded[4],
-                    'latitude': float(row_padded[5]) if row_padded[5] else None,
-                    'longitude': float(row_padded[6]) if row_padded[6] else None,
-                    'organization': row_padded[7],  # New field
-                    'role': row_padded[8],  # New field
-                }
-                people.append(person)
+                people.append(parse_person_row(row))
             except (ValueError, TypeError) as e:
                 logger.error(f"Error processing row {row}: {str(e)}")
                 continue
         logger.info(f"fetch_people_data: processed {len(people)} people records")
         return people
+    except SheetsUnavailable as e:
+        logger.warning(f"Skipping sheet fetch: {str(e)}")
+        return []
     except HttpError as err:
         logger.error(f"Google Sheets API error: {str(err)}")
         return []
@@ -138,10 +661,2222 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     c = 2 * atan2(sqrt(a), sqrt(1-a))
     return R * c
 
+def haversine_radians(lat1, lon1, lat2, lon2):
+    """Element-wise (broadcasting) haversine distance in km between points given in radians."""
+    R = 6371  # Earth radius in kilometers
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    a = np.clip(a, 0.0, 1.0)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return R * c
+
+def haversine_matrix(q_lat, q_lon, p_lat, p_lon):
+    """Vectorized haversine: distances (km) from each query point to each person, all in radians.
+
+    Returns an array of shape (len(q_lat), len(p_lat)).
+    """
+    return haversine_radians(q_lat[:, np.newaxis], q_lon[:, np.newaxis],
+                             p_lat[np.newaxis, :], p_lon[np.newaxis, :])
+
+# -------------------------------------------------
+# Directory snapshot
+# -------------------------------------------------
+
+class GeoPartition:
+    """Contiguous coordinate arrays for one slice of the directory's geo-valid subset.
+
+    rows holds row ids into snapshot.people, lat/lon the matching coordinates in radians.
+    Query helpers return positions into these arrays. The arrays are over-allocated so
+    people added after the snapshot was loaded can be appended in place.
+    """
+
+    def __init__(self, rows, lat, lon):
+        self._rows = rows
+        self._lat = lat
+        self._lon = lon
+        self._size = len(rows)
+        self._grid = None
+
+    @property
+    def rows(self):
+        return self._rows[:self._size]
+
+    @property
+    def lat(self):
+        return self._lat[:self._size]
+
+    @property
+    def lon(self):
+        return self._lon[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def take(self, positions):
+        return GeoPartition(self.rows[positions], self.lat[positions], self.lon[positions])
+
+    def add(self, row, lat, lon):
+        """Append one person, coordinates in degrees."""
+        position = self._size
+        if position == len(self._rows):
+            capacity = max(16, 2 * position)
+            self._rows = np.concatenate([self._rows, np.zeros(capacity - position, dtype=np.int64)])
+            self._lat = np.concatenate([self._lat, np.zeros(capacity - position)])
+            self._lon = np.concatenate([self._lon, np.zeros(capacity - position)])
+        self._rows[position] = row
+        self._lat[position] = radians(lat)
+        self._lon[position] = radians(lon)
+        self._size += 1
+        if self._grid is not None:
+            self._grid.add(position, self._lat[position], self._lon[position])
+
+    def position_of(self, row):
+        positions = np.nonzero(self.rows == row)[0]
+        return int(positions[0]) if len(positions) else None
+
+    def remove(self, position):
+        """Drop one person by moving the last one into its slot."""
+        last = self._size - 1
+        if self._grid is not None:
+            self._grid.discard(position, self._lat[position], self._lon[position])
+            if position != last:
+                self._grid.discard(last, self._lat[last], self._lon[last])
+        if position != last:
+            self._rows[position] = self._rows[last]
+            self._lat[position] = self._lat[last]
+            self._lon[position] = self._lon[last]
+            if self._grid is not None:
+                self._grid.add(position, self._lat[position], self._lon[position])
+        self._size -= 1
+
+    def distances(self, lat, lon, positions=None):
+        """Distances (km) from (lat, lon) in degrees to the partition, or to the given positions of it."""
+        p_lat, p_lon = (self.lat, self.lon) if positions is None else (self.lat[positions], self.lon[positions])
+        return haversine_matrix(np.radians([lat]), np.radians([lon]), p_lat, p_lon)[0]
+
+    def grid(self):
+        """Lazily built GeoGrid over this partition."""
+        if self._grid is None:
+            self._grid = GeoGrid(self, GEO_GRID_CELL_DEG)
+        return self._grid
+
+    def iter_nearby(self, lat, lon, radius_km):
+        """Yield (distance_km, position) for everyone within radius_km, nearest first.
+
+        Cells of the grid are visited in order of their minimum possible distance to the
+        query, ring by ring outwards. A match is only yielded once no unvisited cell can
+        hold anyone closer, so only the current ring's matches are ever held in memory.
+        Each cell's matches are followed by a None marker, a natural point to flush output.
+        """
+        grid = self.grid()
+        lower_bounds = grid.lower_bounds(lat, lon)
+        cells = np.nonzero(lower_bounds <= radius_km)[0]
+        cells = cells[np.argsort(lower_bounds[cells], kind='stable')]
+        pending = []
+        for cell in cells:
+            bound = lower_bounds[cell]
+            while pending and pending[0][0] < bound:
+                yield heapq.heappop(pending)
+            yield None
+            positions = grid.members[cell]
+            for position, dist in zip(positions, self.distances(lat, lon, positions)):
+                if dist <= radius_km:
+                    heapq.heappush(pending, (float(dist), int(position)))
+        while pending:
+            yield heapq.heappop(pending)
+
+class GeoGrid:
+    """Fixed-size lat/lon cells over a GeoPartition, used to expand nearby searches ring by ring.
+
+    Only occupied cells are stored. Each keeps its member positions, its center and the
+    distance from that center to its farthest corner, which gives a cheap lower bound on
+    the distance from any query point to anyone in the cell.
+    """
+
+    def __init__(self, partition, cell_deg):
+        self.cell_deg = cell_deg
+        self.ncols = int(np.ceil(360 / cell_deg)) + 1
+        keys = self._keys(partition.lat, partition.lon)
+        order = np.argsort(keys, kind='stable')
+        cell_keys, starts = np.unique(keys[order], return_index=True)
+        self.members = np.split(order, starts[1:]) if len(order) else []
+        self._cells = {int(key): cell for cell, key in enumerate(cell_keys)}
+        self.center_lat, self.center_lon, self.cell_radius = self._geometry(cell_keys)
+
+    def _keys(self, lat, lon):
+        lat_idx = np.floor((np.degrees(lat) + 90) / self.cell_deg).astype(np.int64)
+        lon_idx = np.floor((np.degrees(lon) + 180) / self.cell_deg).astype(np.int64)
+        return lat_idx * self.ncols + lon_idx
+
+    def _geometry(self, cell_keys):
+        """Center (radians) and center-to-corner distance (km) of each cell."""
+        lat_min = np.clip((cell_keys // self.ncols) * self.cell_deg - 90, -90, 90)
+        lat_max = np.clip(lat_min + self.cell_deg, -90, 90)
+        lon_min = (cell_keys % self.ncols) * self.cell_deg - 180
+        lon_max = lon_min + self.cell_deg
+        center_lat = np.radians((lat_min + lat_max) / 2)
+        center_lon = np.radians((lon_min + lon_max) / 2)
+        corner_dist = [haversine_radians(np.radians(corner_lat), np.radians(corner_lon), center_lat, center_lon)
+                       for corner_lat in (lat_min, lat_max) for corner_lon in (lon_min, lon_max)]
+        # Small slack so floating point error can't make the bound overshoot
+        cell_radius = np.max(corner_dist, axis=0) * 1.0001 + 1e-6 if len(cell_keys) else np.array([])
+        return center_lat, center_lon, cell_radius
+
+    def add(self, position, lat, lon):
+        """Register one more partition position, coordinates in radians."""
+        key = int(self._keys(np.array([lat]), np.array([lon]))[0])
+        cell = self._cells.get(key)
+        if cell is not None:
+            self.members[cell] = np.append(self.members[cell], position)
+            return
+        center_lat, center_lon, cell_radius = self._geometry(np.array([key]))
+        self._cells[key] = len(self.members)
+        self.members.append(np.array([position], dtype=np.int64))
+        self.center_lat = np.append(self.center_lat, center_lat)
+        self.center_lon = np.append(self.center_lon, center_lon)
+        self.cell_radius = np.append(self.cell_radius, cell_radius)
+
+    def discard(self, position, lat, lon):
+        """Forget a partition position, coordinates in radians."""
+        cell = self._cells.get(int(self._keys(np.array([lat]), np.array([lon]))[0]))
+        if cell is not None:
+            self.members[cell] = self.members[cell][self.members[cell] != position]
+
+    def lower_bounds(self, lat, lon):
+        """Lower bound on the distance (km) from (lat, lon) to anyone in each occupied cell."""
+        dist = haversine_matrix(np.radians([lat]), np.radians([lon]), self.center_lat, self.center_lon)[0]
+        return np.maximum(dist - self.cell_radius, 0.0)
+
+def _empty_partition():
+    return GeoPartition(np.array([], dtype=np.int64), np.array([]), np.array([]))
+
+_EMPTY_PARTITION = _empty_partition()
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on a blake2b digest)."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1024)
+        self.size = int(-capacity * log(error_rate) / (log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+def person_search_text(person):
+    """Lowercased haystack /api/search matches against; fields are separated so matches can't span them."""
+    return '\x1f'.join((person[field] or '').lower() for field in ('name', 'organization', 'role', 'email'))
+
+class PeopleSnapshot:
+    """A point-in-time copy of the directory fetched from Google Sheets.
+
+    Besides the people themselves it carries the derived indexes the read endpoints
+    use: id, email, organization, search text and the geo partitions. Rows submitted
+    since the sheet was read are added with add_person() and stay tagged 'pending'
+    until the sheet writer confirms them.
+    """
+
+    def __init__(self, people, version):
+        self.people = people
+        self.version = version
+        # Bumped by every add_person(), so caches derived from the snapshot can key on it
+        self.revision = 0
+        self.loaded_at = time.time()
+        self._loaded_monotonic = time.monotonic()
+        self._lock = threading.Lock()
+        self.id_index = {}
+        self.email_index = {}
+        self.org_index = {}
+        self.search_text = []
+        # Sized with headroom for people added after the sheet was read
+        self.email_bloom = BloomFilter(2 * len(people)) if EMAIL_BLOOM_FILTER else None
+        for row, person in enumerate(people):
+            self._index_person(row, person)
+        # Geo queries only ever look at this validated subset
+        rows, lat, lon, self.geo_missing, self.geo_rejected = build_geo_subset(people)
+        if self.geo_rejected:
+            logger.warning(f"Snapshot {version}: rejected {self.geo_rejected} rows with out-of-range coordinates")
+        self.geo = GeoPartition(rows, lat, lon)
+        # Per-organization partitions, so org-scoped queries only touch that organization
+        by_org = {}
+        for position, row in enumerate(rows):
+            org = (people[row]['organization'] or '').lower()
+            if org:
+                by_org.setdefault(org, []).append(position)
+        self.geo_by_org = {org: self.geo.take(np.array(positions, dtype=np.int64))
+                           for org, positions in by_org.items()}
+
+    @staticmethod
+    def _index_keys(person):
+        """What the id, email, organization and search indexes hold for a person."""
+        person_id = None if person['id'] is None else str(person['id'])
+        org = (person['organization'] or '').lower()
+        return person_id, normalize_email(person['email']), org, person_search_text(person)
+
+    def _index_person(self, row, person, keys=None):
+        person_id, email, org, search_text = keys or self._index_keys(person)
+        if person_id is not None:
+            self.id_index.setdefault(person_id, row)
+        if email:
+            self.email_index.setdefault(email, row)
+            if self.email_bloom is not None:
+                self.email_bloom.add(email)
+        if org:
+            self.org_index.setdefault(org, []).append(row)
+        self.search_text.append(search_text)
+
+    def _index_geo(self, row, person):
+        lat, lon = person['latitude'], person['longitude']
+        if lat is None or lon is None:
+            self.geo_missing += 1
+        elif not valid_coordinates(lat, lon):
+            self.geo_rejected += 1
+        else:
+            self.geo.add(row, lat, lon)
+            org = (person['organization'] or '').lower()
+            if org:
+                self.geo_by_org.setdefault(org, _empty_partition()).add(row, lat, lon)
+
+    def _unindex_geo(self, row, person):
+        lat, lon = person['latitude'], person['longitude']
+        if lat is None or lon is None:
+            self.geo_missing -= 1
+        elif not valid_coordinates(lat, lon):
+            self.geo_rejected -= 1
+        else:
+            partitions = [self.geo]
+            org = (person['organization'] or '').lower()
+            if org in self.geo_by_org:
+                partitions.append(self.geo_by_org[org])
+            for partition in partitions:
+                position = partition.position_of(row)
+                if position is not None:
+                    partition.remove(position)
+
+    def add_person(self, person):
+        """Append a person and update every derived index in place."""
+        # Derived first: a person that can't be indexed must not leave the indexes half-updated
+        keys = self._index_keys(person)
+        with self._lock:
+            row = len(self.people)
+            self.people.append(person)
+            self._index_person(row, person, keys)
+            self._index_geo(row, person)
+            self.revision += 1
+        return row
+
+    def update_person(self, row, person):
+        """Replace the person at row, keeping its id and email, and re-index what changed."""
+        _, _, new_org, search_text = self._index_keys(person)
+        with self._lock:
+            old = self.people[row]
+            self._unindex_geo(row, old)
+            old_org = (old['organization'] or '').lower()
+            if old_org != new_org:
+                if old_org:
+                    self.org_index[old_org].remove(row)
+                if new_org:
+                    self.org_index.setdefault(new_org, []).append(row)
+            self.people[row] = person
+            self.search_text[row] = search_text
+            self._index_geo(row, person)
+            self.revision += 1
+
+    def has_email(self, email):
+        """O(1) membership test for a normalized email."""
+        if self.email_bloom is not None and email not in self.email_bloom:
+            profile_check_stats['bloom_negatives'] += 1
+            return False
+        return email in self.email_index
+
+    def confirm(self, person_ids):
+        """Clear the pending tag of people the sheet writer has stored."""
+        for person_id in person_ids:
+            row = self.id_index.get(str(person_id))
+            if row is not None:
+                self.people[row].pop('pending', None)
+
+    def age(self):
+        return time.monotonic() - self._loaded_monotonic
+
+    def geo_partition(self, org=''):
+        """The geo partition for an organization (case-insensitive), or the whole directory."""
+        if not org:
+            return self.geo
+        return self.geo_by_org.get(org.lower(), _EMPTY_PARTITION)
+
+def valid_coordinates(lat, lon):
+    return (lat is not None and lon is not None
+            and isfinite(lat) and isfinite(lon)
+            and -90 <= lat <= 90 and -180 <= lon <= 180)
+
+def build_geo_subset(people):
+    """Validate coordinates once and return (rows, lat_rad, lon_rad, missing, rejected)."""
+    rows, lats, lons = [], [], []
+    missing = rejected = 0
+    for i, p in enumerate(people):
+        lat, lon = p['latitude'], p['longitude']
+        if lat is None or lon is None:
+            missing += 1
+        elif not valid_coordinates(lat, lon):
+            rejected += 1
+        else:
+            rows.append(i)
+            lats.append(lat)
+            lons.append(lon)
+    return (np.array(rows, dtype=np.int64),
+            np.radians(np.array(lats, dtype=np.float64)),
+            np.radians(np.array(lons, dtype=np.float64)),
+            missing, rejected)
+
+_snapshot = None
+_snapshot_version = 0
+_snapshot_lock = threading.Lock()
+
+def served_snapshot(snapshot):
+    """Remember which snapshot answered the current request, for the staleness headers."""
+    if has_request_context():
+        g.people_snapshot = snapshot
+    return snapshot
+
+def get_people_snapshot(priority=PRIORITY_READ):
+    """Return the current directory snapshot, re-reading the sheet once it is older than PEOPLE_CACHE_TTL.
+
+    If the sheet can't be read (or the Sheets circuit breaker is open) the last
+    good snapshot is served as-is, however old it is.
+    """
+    global _snapshot, _snapshot_version
+    with _snapshot_lock:
+        if _snapshot is not None and (_snapshot.age() < PEOPLE_CACHE_TTL or sheets_breaker.is_open()):
+            return served_snapshot(_snapshot)
+        # Rows queued before or during the fetch that the sheet doesn't have yet are
+        # re-applied as pending, so readers keep seeing their own writes
+        queued = sheet_queue.pending_writes()
+        people = fetch_people_data(priority)
+        _snapshot_version += 1
+        snapshot = PeopleSnapshot(people, _snapshot_version)
+        # An empty result usually means the fetch failed, so don't keep it around
+        if people:
+            id_allocator.observe(max_person_id(p['id'] for p in people))
+            _snapshot = snapshot
+            for op, row in queued + sheet_queue.pending_writes():
+                if op == 'update':
+                    apply_updated_row(row)
+                else:
+                    apply_submitted_row(row)
+        elif _snapshot is not None:
+            logger.warning(f"Sheet fetch failed, serving snapshot from {_snapshot.age():.0f}s ago")
+            return served_snapshot(_snapshot)
+        return served_snapshot(snapshot)
+
+_refresh_in_flight = False
+
+def refresh_snapshot_in_background():
+    """Start a snapshot refresh unless one is already running."""
+    global _refresh_in_flight
+    if _refresh_in_flight:
+        return
+    _refresh_in_flight = True
+
+    def refresh():
+        global _refresh_in_flight
+        try:
+            get_people_snapshot(PRIORITY_BACKGROUND)
+        finally:
+            _refresh_in_flight = False
+
+    socketio.start_background_task(refresh)
+
+def current_people_snapshot():
+    """Return the live snapshot without waiting on the sheet.
+
+    A stale snapshot is still served while a background task re-reads the sheet;
+    only a cold start, with no snapshot at all, has to block.
+    """
+    snapshot = _snapshot
+    if snapshot is None:
+        return get_people_snapshot()
+    if snapshot.age() >= PEOPLE_CACHE_TTL and not sheets_breaker.is_open():
+        refresh_snapshot_in_background()
+    return served_snapshot(snapshot)
+
+def pending_person(row):
+    person = parse_person_row(row)
+    person['pending'] = True
+    return person
+
+def apply_submitted_row(row):
+    """Write-through: make a just-queued row visible in the live snapshot."""
+    snapshot = _snapshot
+    if snapshot is None or str(row[0]) in snapshot.id_index:
+        return
+    try:
+        snapshot.add_person(pending_person(row))
+    except Exception as e:
+        # Same rule as fetch_people_data(): unparseable rows are left out of the directory.
+        # The row is already queued, so this must not fail the request that queued it.
+        logger.error(f"Error processing submitted row {row}: {str(e)}")
+
+def apply_updated_row(row):
+    """Write-through for a queued update: replace the person in the live snapshot."""
+    snapshot = _snapshot
+    if snapshot is None:
+        return
+    existing = snapshot.id_index.get(str(row[0]))
+    if existing is None:
+        apply_submitted_row(row)
+        return
+    try:
+        snapshot.update_person(existing, pending_person(row))
+    except Exception as e:
+        logger.error(f"Error processing updated row {row}: {str(e)}")
+
+def confirm_submitted_rows(rows):
+    snapshot = _snapshot
+    if snapshot is not None:
+        snapshot.confirm(row[0] for row in rows)
+
+# -------------------------------------------------
+# Submissions
+# -------------------------------------------------
+
+SUBMISSION_REQUIRED_FIELDS = ('name', 'email', 'organization')
+SUBMISSION_TEXT_FIELDS = ('name', 'email', 'organization', 'new_organization', 'phone', 'photo_url', 'role')
+
+def validate_submission(data):
+    """Return an error message for an invalid submission, or None if it can be stored."""
+    if not isinstance(data, dict):
+        return 'Expected a JSON object'
+    for field in SUBMISSION_REQUIRED_FIELDS:
+        if not data.get(field):
+            return f'{field} is required'
+    for field in SUBMISSION_TEXT_FIELDS:
+        value = data.get(field)
+        if value is not None and not isinstance(value, str):
+            return f'{field} must be a string'
+        if value is not None and len(value) > SHEETS_CELL_MAX_CHARS:
+            return f'{field} must be at most {SHEETS_CELL_MAX_CHARS} characters'
+    for field, limit in (('latitude', 90), ('longitude', 180)):
+        value = data.get(field)
+        if value is None or value == '':
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return f'{field} must be a number'
+        if not (isfinite(value) and -limit <= value <= limit):
+            return f'{field} must be between -{limit} and {limit}'
+    return None
+
+class KeyedLocks:
+    """Per-key locks, created on demand and dropped once nobody holds or waits on them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}  # key -> [lock, holders]
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+# Serializes submissions for the same normalized email
+submission_locks = KeyedLocks()
+
+def sheet_cell(value):
+    """A submitted value as the sheet (and the snapshot) stores it: text, empty when missing."""
+    return '' if value is None else str(value)
+
+def submission_row(person_id, data):
+    """Build the sheet row for a validated submission."""
+    # If organization is "other", use the new_organization value
+    organization = data.get('new_organization') if data.get('organization') == 'other' else data.get('organization')
+    return [sheet_cell(value) for value in (
+        person_id,
+        data.get('name'),
+        data.get('photo_url'),
+        data.get('phone'),
+        data.get('email'),
+        data.get('latitude'),
+        data.get('longitude'),
+        organization,
+        data.get('role'),
+    )]
+
+# -------------------------------------------------
+# Person ID allocation
+# -------------------------------------------------
+
+def max_person_id(ids):
+    """Largest numeric ID among the given sheet IDs, or 0."""
+    highest = 0
+    for person_id in ids:
+        try:
+            highest = max(highest, int(str(person_id).strip()))
+        except (TypeError, ValueError):
+            continue
+    return highest
+
+class IdAllocator:
+    """Hands out monotonically increasing person IDs, persisted in SQLite.
+
+    The sequence is reconciled with the sheet whenever a snapshot is loaded (observe),
+    so IDs never go backwards even if rows were added to the sheet by hand. Allocation
+    runs in an IMMEDIATE transaction, which keeps it safe across threads, greenlets and
+    worker processes sharing the same state file.
+    """
+
+    def __init__(self, path, name='people'):
+        self.path = path
+        self.name = name
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS id_sequences (
+                                name TEXT PRIMARY KEY,
+                                next_id INTEGER NOT NULL,
+                                reconciled_at REAL)""")
+            conn.execute("INSERT OR IGNORE INTO id_sequences (name, next_id) VALUES (?, 1)", (self.name,))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @property
+    def reconciled(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT reconciled_at FROM id_sequences WHERE name = ?", (self.name,)).fetchone()
+        return bool(row and row[0])
+
+    def observe(self, max_id):
+        """Make sure future IDs are greater than max_id."""
+        with self._lock, self._connect() as conn:
+            conn.execute("""UPDATE id_sequences SET next_id = MAX(next_id, ?), reconciled_at = ?
+                            WHERE name = ?""", (max_id + 1, time.time(), self.name))
+
+    def allocate(self, count=1):
+        """Reserve count consecutive IDs and return the first one."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                (first,) = conn.execute("SELECT next_id FROM id_sequences WHERE name = ?", (self.name,)).fetchone()
+                conn.execute("UPDATE id_sequences SET next_id = ? WHERE name = ?", (first + count, self.name))
+                conn.execute("COMMIT")
+                return first
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+id_allocator = IdAllocator(STATE_DB_PATH)
+
+# -------------------------------------------------
+# Write-behind sheet queue
+# -------------------------------------------------
+
+class SheetWriteQueue:
+    """Durable FIFO of sheet writes, stored in SQLite.
+
+    Each entry is an 'append' of a new row or an 'update' of an existing person's row
+    (matched on the ID column when flushed). Submissions are acknowledged as soon as
+    their entry is committed here; the sheet writer drains the queue in order. Writes
+    the sheet keeps refusing are moved to the sheet_dead_letters table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.flushed_rows = 0
+        self.flush_batches = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+        self.last_error = None
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS sheet_write_queue (
+                                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                                row TEXT NOT NULL,
+                                enqueued_at REAL NOT NULL,
+                                attempts INTEGER NOT NULL DEFAULT 0,
+                                last_error TEXT,
+                                op TEXT NOT NULL DEFAULT 'append')""")
+            # State files created before updates were queued lack the op column
+            columns = {column[1] for column in conn.execute("PRAGMA table_info(sheet_write_queue)")}
+            if 'op' not in columns:
+                conn.execute("ALTER TABLE sheet_write_queue ADD COLUMN op TEXT NOT NULL DEFAULT 'append'")
+            conn.execute("""CREATE TABLE IF NOT EXISTS sheet_dead_letters (
+                                seq INTEGER PRIMARY KEY,
+                                op TEXT NOT NULL,
+                                row TEXT NOT NULL,
+                                enqueued_at REAL NOT NULL,
+                                attempts INTEGER NOT NULL,
+                                last_error TEXT,
+                                failed_at REAL NOT NULL)""")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def enqueue(self, rows):
+        """Durably queue sheet rows (lists of cell values) to append, returning their sequence numbers."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            seqs = [conn.execute("INSERT INTO sheet_write_queue (row, enqueued_at) VALUES (?, ?)",
+                                 (json.dumps(row), now)).lastrowid
+                    for row in rows]
+        return seqs
+
+    def enqueue_update(self, row):
+        """Queue new contents for an existing person's row.
+
+        If a write for the same ID is still queued it is rewritten in place, so the
+        sheet only ever receives the latest version.
+        """
+        with self._lock, self._connect() as conn:
+            rewritten = conn.execute("""UPDATE sheet_write_queue SET row = ?
+                                        WHERE seq = (SELECT MAX(seq) FROM sheet_write_queue
+                                                     WHERE json_extract(row, '$[0]') = ?)""",
+                                     (json.dumps(row), str(row[0]))).rowcount
+            if not rewritten:
+                conn.execute("INSERT INTO sheet_write_queue (row, enqueued_at, op) VALUES (?, ?, 'update')",
+                             (json.dumps(row), time.time()))
+
+    def peek(self, limit):
+        """Oldest queued writes as (seq, op, row, attempts) tuples."""
+        with self._connect() as conn:
+            return [(seq, op, json.loads(row), attempts) for seq, op, row, attempts in conn.execute(
+                "SELECT seq, op, row, attempts FROM sheet_write_queue ORDER BY seq LIMIT ?", (limit,))]
+
+    def pending_writes(self):
+        """Every queued write as (op, row), oldest first."""
+        with self._connect() as conn:
+            return [(op, json.loads(row)) for op, row in conn.execute(
+                "SELECT op, row FROM sheet_write_queue ORDER BY seq")]
+
+    def ack(self, writes):
+        """Remove flushed writes and return the rows that were stored as queued.
+
+        A row rewritten by enqueue_update() while it was being flushed stays queued,
+        as an update, so its newer contents still reach the sheet.
+        """
+        stored = []
+        with self._lock, self._connect() as conn:
+            for seq, _, row, _ in writes:
+                if conn.execute("DELETE FROM sheet_write_queue WHERE seq = ? AND row = ?",
+                                (seq, json.dumps(row))).rowcount:
+                    stored.append(row)
+                else:
+                    conn.execute("UPDATE sheet_write_queue SET op = 'update' WHERE seq = ?", (seq,))
+        self.flushed_rows += len(writes)
+        self.flush_batches += 1
+        return stored
+
+    def fail(self, seqs, error):
+        with self._lock, self._connect() as conn:
+            conn.executemany("UPDATE sheet_write_queue SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                             [(str(error), seq) for seq in seqs])
+        self.failed_flushes += 1
+        self.last_error = str(error)
+
+    def dead_letter(self, seqs):
+        """Move writes out of the queue so the ones behind them can be flushed."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            for seq in seqs:
+                conn.execute("""INSERT OR REPLACE INTO sheet_dead_letters
+                                    (seq, op, row, enqueued_at, attempts, last_error, failed_at)
+                                SELECT seq, op, row, enqueued_at, attempts, last_error, ?
+                                FROM sheet_write_queue WHERE seq = ?""", (now, seq))
+                conn.execute("DELETE FROM sheet_write_queue WHERE seq = ?", (seq,))
+        self.dead_lettered += len(seqs)
+
+    def dead_letters(self):
+        """Dead-lettered writes as (seq, op, row, attempts, last_error), oldest first."""
+        with self._connect() as conn:
+            return [(seq, op, json.loads(row), attempts, last_error)
+                    for seq, op, row, attempts, last_error in conn.execute(
+                        "SELECT seq, op, row, attempts, last_error FROM sheet_dead_letters ORDER BY seq")]
+
+    def stats(self):
+        with self._connect() as conn:
+            depth, oldest = conn.execute("SELECT COUNT(*), MIN(enqueued_at) FROM sheet_write_queue").fetchone()
+            (dead_letters,) = conn.execute("SELECT COUNT(*) FROM sheet_dead_letters").fetchone()
+        return {
+            'depth': depth,
+            'oldest_age_seconds': round(time.time() - oldest, 3) if oldest else None,
+            'flushed_rows': self.flushed_rows,
+            'flush_batches': self.flush_batches,
+            'failed_flushes': self.failed_flushes,
+            'dead_letters': dead_letters,
+            'dead_lettered': self.dead_lettered,
+            'last_error': self.last_error,
+        }
+
+sheet_queue = SheetWriteQueue(STATE_DB_PATH)
+
+def append_sheet_rows(service, rows):
+    result = execute_sheets_request(lambda: service.spreadsheets().values().append(
+        spreadsheetId=SPREADSHEET_ID,
+        range=APPEND_RANGE,
+        valueInputOption='RAW',
+        insertDataOption='INSERT_ROWS',
+        body={'values': rows}
+    ), PRIORITY_WRITE)
+    logger.info(f"Appended {len(rows)} rows to {result.get('updates', {}).get('updatedRange')}")
+
+def update_sheet_rows(service, rows):
+    """Overwrite existing rows in place, locating them by the ID column."""
+    result = execute_sheets_request(lambda: service.spreadsheets().values().get(
+        spreadsheetId=SPREADSHEET_ID,
+        range=ID_RANGE_NAME
+    ), PRIORITY_WRITE)
+    sheet_rows = {}
+    for offset, cells in enumerate(result.get('values', [])):
+        if cells:
+            sheet_rows.setdefault(str(cells[0]).strip(), offset + 2)  # +2 because we start from A2
+    data, missing = [], []
+    for row in rows:
+        sheet_row = sheet_rows.get(str(row[0]))
+        if sheet_row is None:
+            missing.append(row)
+        else:
+            data.append({'range': f'Sheet1!A{sheet_row}:I{sheet_row}', 'values': [row]})
+    if data:
+        execute_sheets_request(lambda: service.spreadsheets().values().batchUpdate(
+            spreadsheetId=SPREADSHEET_ID,
+            body={'valueInputOption': 'RAW', 'data': data}
+        ), PRIORITY_WRITE)
+        logger.info(f"Updated {len(data)} rows in place")
+    if missing:
+        logger.warning(f"{len(missing)} updated people are no longer in the sheet, appending them again")
+        append_sheet_rows(service, missing)
+
+def rows_rejected(error):
+    """True if the Sheets API refused the rows themselves (e.g. an oversized cell); retrying won't help."""
+    return isinstance(error, HttpError) and error.resp.status == 400
+
+def flush_sheet_queue():
+    """Write queued rows to the sheet in order, one API call per run of appends or updates.
+
+    Returns the number of seconds to wait before retrying after a failure, or 0.
+    A failed run stays at the head of the queue so ordering is preserved, until it
+    has failed SHEET_MAX_ATTEMPTS times. A run the API rejects outright is split in
+    halves until the offending row is found; that row is dead-lettered at once.
+    """
+    limit = SHEET_WRITE_BATCH_SIZE
+    while True:
+        batch = sheet_queue.peek(limit)
+        if not batch:
+            return 0
+        op = batch[0][1]
+        run = []
+        for write in batch:
+            if write[1] != op:
+                break
+            run.append(write)
+        rows = [row for _, _, row, _ in run]
+        try:
+            service = get_google_sheets_service()
+            if not service:
+                raise RuntimeError("Failed to create Google Sheets service")
+            if op == 'update':
+                update_sheet_rows(service, rows)
+            else:
+                append_sheet_rows(service, rows)
+        except SheetsUnavailable:
+            # Not the rows' fault, so don't count it against them; wait for the next probe
+            return max(sheets_breaker.retry_in(), SHEET_FLUSH_INTERVAL)
+        except Exception as e:
+            rejected = rows_rejected(e)
+            if rejected and len(run) > 1:
+                limit = max(1, len(run) // 2)
+                logger.warning(f"Sheets API rejected {len(run)} queued rows, retrying them {limit} at a time")
+                continue
+            logger.error(f"Error flushing {len(run)} queued rows to the sheet: {str(e)}")
+            seqs = [seq for seq, _, _, _ in run]
+            sheet_queue.fail(seqs, e)
+            attempts = max(attempts for _, _, _, attempts in run) + 1
+            if not rejected and attempts < SHEET_MAX_ATTEMPTS:
+                return min(SHEET_RETRY_MAX_DELAY, 2 ** attempts)
+            logger.error(f"Giving up on {len(run)} queued rows after {attempts} attempts, moving them to the dead-letter table")
+            sheet_queue.dead_letter(seqs)
+            limit = SHEET_WRITE_BATCH_SIZE
+            continue
+        confirm_submitted_rows(sheet_queue.ack(run))
+
+_sheet_writer_started = False
+_sheet_writer_lock = threading.Lock()
+
+def sheet_writer():
+    """Background task draining the sheet write queue."""
+    logger.info("Sheet writer started")
+    while True:
+        delay = flush_sheet_queue()
+        socketio.sleep(delay or SHEET_FLUSH_INTERVAL)
+
+def ensure_sheet_writer():
+    global _sheet_writer_started
+    with _sheet_writer_lock:
+        if not _sheet_writer_started:
+            _sheet_writer_started = True
+            socketio.start_background_task(sheet_writer)
+
+def reconcile_ids_from_sheet(service):
+    """One-off sync of the ID sequence for a fresh state file, reading only the ID column."""
+    result = execute_sheets_request(lambda: service.spreadsheets().values().get(
+        spreadsheetId=SPREADSHEET_ID,
+        range=ID_RANGE_NAME
+    ), PRIORITY_WRITE)
+    ids = [row[0] for row in result.get('values', []) if row]
+    id_allocator.observe(max_person_id(ids))
+    logger.info(f"Reconciled ID sequence with {len(ids)} sheet rows")
+
+# -------------------------------------------------
+# Bulk import
+# -------------------------------------------------
+
+class ImportJob:
+    """Progress of one /api/import upload, polled through GET /api/import/<job_id>."""
+
+    MAX_ERRORS = 20  # error samples kept per job
+
+    def __init__(self, fmt):
+        self.id = uuid.uuid4().hex
+        self.format = fmt
+        self.status = 'queued'
+        self.processed = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def reject(self, line, error):
+        self.invalid += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append({'line': line, 'error': error})
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'format': self.format,
+            'status': self.status,
+            'processed': self.processed,
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'errors': self.errors,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+import_jobs = OrderedDict()
+
+def register_import_job(job):
+    import_jobs[job.id] = job
+    while len(import_jobs) > IMPORT_JOBS_KEPT:
+        import_jobs.popitem(last=False)
+
+def iter_import_records(stream, fmt):
+    """Yield (line_number, record_or_None, error) from a CSV or JSONL text stream, one row at a time."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError as e:
+            yield line_number, None, f'invalid JSON: {str(e)}'
+
+def queue_import_chunk(job, chunk):
+    """Allocate IDs for a chunk of validated records and queue them for the sheet."""
+    first_id = id_allocator.allocate(len(chunk))
+    rows = [submission_row(first_id + i, record) for i, record in enumerate(chunk)]
+    sheet_queue.enqueue(rows)
+    for row in rows:
+        apply_submitted_row(row)
+    # Only once the whole chunk is queued and in the email index, so a rerun skips it
+    job.accepted += len(rows)
+    ensure_sheet_writer()
+
+def run_import(job, path):
+    """Background task: validate, deduplicate and queue an uploaded file chunk by chunk."""
+    job.status = 'running'
+    try:
+        snapshot = get_people_snapshot()
+        if snapshot is not _snapshot:
+            raise RuntimeError('directory snapshot unavailable, cannot deduplicate by email')
+        if not id_allocator.reconciled:
+            reconcile_ids_from_sheet(get_google_sheets_service())
+
+        chunk, chunk_emails = [], set()
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            for line_number, record, error in iter_import_records(stream, job.format):
+                job.processed += 1
+                error = error or validate_submission(record)
+                if error:
+                    job.reject(line_number, error)
+                    continue
+                # Earlier chunks are already in the email index through write-through
+                email = normalize_email(record.get('email'))
+                if email in chunk_emails or email in get_people_snapshot().email_index:
+                    job.duplicates += 1
+                    continue
+                chunk.append(record)
+                chunk_emails.add(email)
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    queue_import_chunk(job, chunk)
+                    chunk, chunk_emails = [], set()
+                    logger.info(f"Import {job.id}: {job.processed} rows processed, {job.accepted} queued")
+                    socketio.sleep(0)
+        if chunk:
+            queue_import_chunk(job, chunk)
+        job.status = 'done'
+        logger.info(f"Import {job.id} finished: {job.to_dict()}")
+    except Exception as e:
+        job.status = 'failed'
+        job.errors.append({'line': None, 'error': str(e)})
+        logger.error(f"Import {job.id} failed: {str(e)}")
+    finally:
+        job.finished_at = time.time()
+        os.remove(path)
+
+# -------------------------------------------------
+# Bulk export
+# -------------------------------------------------
+
+def parse_bbox(value):
+    """Parse 'min_lon,min_lat,max_lon,max_lat'; min_lon > max_lon means the box crosses the antimeridian."""
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+    min_lon, min_lat, max_lon, max_lat = parts
+    if not (valid_coordinates(min_lat, min_lon) and valid_coordinates(max_lat, max_lon)) or min_lat > max_lat:
+        raise ValueError(f'invalid bbox: {value}')
+    return min_lon, min_lat, max_lon, max_lat
+
+def export_rows(snapshot, org, bbox):
+    """Row ids to export, in directory order, without copying any people."""
+    if bbox is None:
+        return snapshot.org_index.get(org.lower(), []) if org else range(len(snapshot.people))
+    min_lon, min_lat, max_lon, max_lat = np.radians(bbox)
+    partition = snapshot.geo_partition(org)
+    in_lat = (partition.lat >= min_lat) & (partition.lat <= max_lat)
+    if min_lon <= max_lon:
+        in_lon = (partition.lon >= min_lon) & (partition.lon <= max_lon)
+    else:
+        in_lon = (partition.lon >= min_lon) | (partition.lon <= max_lon)
+    return np.sort(partition.rows[in_lat & in_lon])
+
+def iter_export_chunks(snapshot, rows):
+    """Yield lists of at most EXPORT_CHUNK_SIZE people."""
+    for start in range(0, len(rows), EXPORT_CHUNK_SIZE):
+        yield [snapshot.people[row] for row in rows[start:start + EXPORT_CHUNK_SIZE]]
+
+def export_ndjson(snapshot, rows):
+    for chunk in iter_export_chunks(snapshot, rows):
+        yield ''.join(json.dumps({field: person[field] for field in EXPORT_FIELDS}) + '\n' for person in chunk)
+
+def export_csv(snapshot, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for chunk in iter_export_chunks(snapshot, rows):
+        writer.writerows([person[field] for field in EXPORT_FIELDS] for person in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to a generator instead of keeping them."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def export_parquet(snapshot, rows):
+    """Stream a parquet file, one row group per chunk."""
+    float_fields = ('latitude', 'longitude')
+    schema = pa.schema([(field, pa.float64() if field in float_fields else pa.string())
+                        for field in EXPORT_FIELDS])
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in iter_export_chunks(snapshot, rows):
+        columns = {}
+        for field in EXPORT_FIELDS:
+            values = [person[field] for person in chunk]
+            # Coerced to the schema: a stray non-text cell would otherwise fail a row group
+            # after the response headers are out, truncating the file without an error
+            columns[field] = values if field in float_fields else [None if v is None else str(v) for v in values]
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+EXPORT_FORMATS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+    'csv': (export_csv, 'text/csv'),
+    'parquet': (export_parquet, 'application/vnd.apache.parquet'),
+}
+
+# -------------------------------------------------
+# Geohash-quantized nearby cache
+# -------------------------------------------------
+
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash_cell(lat, lon, precision):
+    """Encode a point as a geohash and return it with the (lat_min, lat_max, lon_min, lon_max) of its cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit, ch, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_GEOHASH_BASE32[ch])
+            bit, ch = 0, 0
+    return ''.join(chars), (lat_range[0], lat_range[1], lon_range[0], lon_range[1])
+
+class NearbyCellCache:
+    """LRU of nearby candidate lists keyed by geohash cell.
+
+    A cell's candidates are everyone within radius + (center-to-corner distance) of
+    the cell center, which is a superset of the people within radius of any point
+    inside the cell, so callers only have to recompute exact distances.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            candidates = self._entries.get(key)
+            if candidates is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return candidates
+
+    def put(self, key, candidates):
+        with self._lock:
+            self._entries[key] = candidates
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': NEARBY_GEOHASH_PRECISION > 0,
+                'precision': NEARBY_GEOHASH_PRECISION,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+nearby_cache = NearbyCellCache(NEARBY_CACHE_SIZE)
+
+profile_check_stats = {'lookups': 0, 'bloom_negatives': 0}
+
+def nearby_candidates(snapshot, partition, lat, lon, radius_km, org):
+    """Return positions (into partition) of people that may lie within radius_km of (lat, lon)."""
+    if NEARBY_GEOHASH_PRECISION <= 0:
+        return np.arange(len(partition))
+
+    cell, (lat_min, lat_max, lon_min, lon_max) = geohash_cell(lat, lon, NEARBY_GEOHASH_PRECISION)
+    key = (snapshot.version, snapshot.revision, cell, radius_km, org.lower())
+    candidates = nearby_cache.get(key)
+    if candidates is not None:
+        return candidates
+
+    center_lat = (lat_min + lat_max) / 2
+    center_lon = (lon_min + lon_max) / 2
+    margin = max(haversine_distance(center_lat, center_lon, corner_lat, corner_lon)
+                 for corner_lat in (lat_min, lat_max)
+                 for corner_lon in (lon_min, lon_max))
+    candidates = np.nonzero(partition.distances(center_lat, center_lon) <= radius_km + margin)[0]
+    nearby_cache.put(key, candidates)
+    return candidates
+
+def stream_nearby(snapshot, partition, lat, lon, radius_km):
+    """Generate NDJSON lines of nearby people in distance order, one chunk per grid cell."""
+    lines = []
+    count = 0
+    for match in partition.iter_nearby(lat, lon, radius_km):
+        if match is None:
+            if lines:
+                yield ''.join(lines)
+                lines = []
+            continue
+        dist, position = match
+        person_copy = snapshot.people[partition.rows[position]].copy()
+        person_copy['distance_km'] = round(dist, 2)
+        lines.append(json.dumps(person_copy) + '\n')
+        count += 1
+    if lines:
+        yield ''.join(lines)
+    logger.info(f"Streamed {count} people within {radius_km}km")
+
+# -------------------------------------------------
+# Batched nearby queries
+# -------------------------------------------------
+
+# Upper bound on distance-matrix cells computed at once, keeps batch memory bounded
+_BATCH_MATRIX_CELLS = 4_000_000
+
+def parse_nearby_query(query):
+    """Validate one /api/nearby/batch entry and return (lat, lon, radius_km, k, organization)."""
+    if not isinstance(query, dict):
+        raise ValueError('each query must be an object')
+    lat = float(query['lat'])
+    lon = float(query['lon'])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f'coordinates out of range: lat={lat}, lon={lon}')
+    radius_km = query.get('radius')
+    k = query.get('k')
+    if radius_km is None and k is None:
+        radius_km = 10
+    radius_km = float(radius_km) if radius_km is not None else None
+    k = int(k) if k is not None else None
+    if k is not None and k < 1:
+        raise ValueError('k must be at least 1')
+    org = (query.get('organization') or '').strip()
+    return lat, lon, radius_km, k, org
+
+def select_nearby(dist, radius_km, k):
+    """Indices into dist of the matches for one query, nearest first."""
+    if radius_km is not None:
+        hits = np.nonzero(dist <= radius_km)[0]
+    else:
+        hits = np.arange(len(dist))
+    if k is not None and len(hits) > k:
+        hits = hits[np.argpartition(dist[hits], k - 1)[:k]]
+    return hits[np.argsort(dist[hits], kind='stable')]
+
+def people_with_distance(snapshot, rows, dist, hits):
+    """Copy the matched people and annotate them with distance_km."""
+    matches = []
+    for h in hits:
+        person_copy = snapshot.people[rows[h]].copy()
+        person_copy['distance_km'] = round(float(dist[h]), 2)
+        matches.append(person_copy)
+    return matches
+
+def batch_nearby(snapshot, queries):
+    """Answer many parsed nearby queries against one snapshot.
+
+    Queries sharing an organization are evaluated together as one distance matrix
+    (split into row chunks so memory stays bounded). Each query gets the people within
+    its radius, or its k nearest (within radius if both are given), sorted by distance.
+    """
+    results = [None] * len(queries)
+    groups = {}
+    for i, (_, _, _, _, org) in enumerate(queries):
+        groups.setdefault(org.lower(), []).append(i)
+
+    for org, query_ids in groups.items():
+        partition = snapshot.geo_partition(org)
+        if len(partition) == 0:
+            for i in query_ids:
+                results[i] = []
+            continue
+
+        chunk = max(1, _BATCH_MATRIX_CELLS // len(partition))
+        for start in range(0, len(query_ids), chunk):
+            chunk_ids = query_ids[start:start + chunk]
+            q_lat = np.radians(np.array([queries[i][0] for i in chunk_ids], dtype=np.float64))
+            q_lon = np.radians(np.array([queries[i][1] for i in chunk_ids], dtype=np.float64))
+            distances = haversine_matrix(q_lat, q_lon, partition.lat, partition.lon)
+            for row, i in enumerate(chunk_ids):
+                _, _, radius_km, k, _ = queries[i]
+                dist = distances[row]
+                results[i] = people_with_distance(snapshot, partition.rows, dist, select_nearby(dist, radius_km, k))
+    return results
+
+# -------------------------------------------------
+# Chat messages
+# -------------------------------------------------
+
+# Fields returned to clients (plus the _id as 'id'); conversation_id and ts are storage/index details
+MESSAGE_FIELDS = ('sender_id', 'receiver_id', 'message', 'timestamp', 'client_msg_id')
+MESSAGE_PROJECTION = dict.fromkeys(MESSAGE_FIELDS + ('_id', 'ts'), 1)
+HISTORY_SORT = [('ts', ASCENDING), ('_id', ASCENDING)]
+_EPOCH = datetime(1970, 1, 1)
+_MAX_OBJECT_ID = ObjectId('f' * 24)
+
+def conversation_id(user1, user2):
+    """Canonical key of a two-person conversation, also used as its Socket.IO room."""
+    return ':'.join(sorted([str(user1), str(user2)]))
+
+def parse_timestamp(value):
+    """Parse an ISO-8601 timestamp into the naive UTC datetime pymongo stores, or None."""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def client_message(doc):
+    """The JSON-safe view of a stored message sent to clients."""
+    message = {field: doc.get(field) for field in MESSAGE_FIELDS}
+    message['id'] = str(doc['_id'])
+    # Server receive time; lets other workers place the message in their room cache
+    message['ts'] = doc['ts'].isoformat() if doc.get('ts') else None
+    return message
+
+def message_position(doc):
+    """Where a stored message sits in history order."""
+    return doc['ts'], doc['_id']
+
+def message_cursor(doc):
+    """Opaque pagination cursor for a stored message: its position in (ts, _id) order."""
+    return f"{(doc['ts'] - _EPOCH) // timedelta(milliseconds=1)}-{doc['_id']}"
+
+def parse_message_cursor(cursor):
+    """Inverse of message_cursor(); raises ValueError on a malformed cursor."""
+    try:
+        millis, oid = cursor.split('-', 1)
+        return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(oid)
+    except (ValueError, InvalidId):
+        raise ValueError(f'Invalid cursor: {cursor}')
+
+def history_page(conversation, limit, before=None, after=None):
+    """One page of a conversation, oldest first, plus whether more lies beyond it.
+
+    Without a cursor the newest page is returned; `before` walks back towards older
+    messages and `after` forward towards newer ones. Served from the room cache when
+    it covers the page, otherwise from the message store.
+    """
+    cached = room_cache.page(conversation, limit, before, after)
+    if cached is not None:
+        docs, has_more = cached
+    else:
+        docs = message_store.history(conversation, limit, before, after)
+        has_more = len(docs) > limit
+        if before is None and not (after is not None and has_more):
+            # The result runs up to the newest message, so it can seed the cache
+            room_cache.load(conversation, docs, complete=after is None and not has_more)
+        docs = docs[:limit] if after is not None else docs[-limit:]
+    cursors = (message_cursor(docs[0]), message_cursor(docs[-1])) if docs else (None, None)
+    return [client_message(doc) for doc in docs], has_more, cursors
+
+def full_history(conversation):
+    """Every message of a conversation in order, for clients that don't paginate."""
+    docs = room_cache.everything(conversation)
+    if docs is None:
+        docs = message_store.all_messages(conversation)
+        room_cache.load(conversation, docs, complete=True)
+    return [client_message(doc) for doc in docs]
+
+def _message_bytes(doc):
+    # Rough footprint of a buffered message: its strings plus dict/datetime/ObjectId overhead
+    return 400 + sum(len(str(doc.get(field) or '')) for field in MESSAGE_FIELDS)
+
+class RoomBuffer:
+    """The latest messages of one room, contiguous in history order.
+
+    Every message after the oldest buffered one is in the buffer; `complete` also
+    means nothing older exists, so the whole conversation is here.
+    """
+
+    __slots__ = ('docs', 'bytes', 'complete')
+
+    def __init__(self):
+        self.docs = deque()
+        self.bytes = 0
+        self.complete = False
+
+class RoomMessageCache:
+    """Memory-capped LRU of per-room ring buffers of recent messages.
+
+    Buffers are fed by every message sent through this process and by history
+    loads that reach the newest message, and answer history pages and reconnect
+    catch-up whenever they provably hold the whole requested range.
+    """
+
+    def __init__(self, size, max_bytes):
+        self.size = size
+        self.max_bytes = max_bytes
+        self._rooms = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _push(self, buffer, doc):
+        position = message_position(doc)
+        if buffer.docs and position <= message_position(buffer.docs[-1]):
+            # Out of order, e.g. relayed from another worker: slot it in from the end
+            index = len(buffer.docs)
+            while index and message_position(buffer.docs[index - 1]) >= position:
+                index -= 1
+                if buffer.docs[index]['_id'] == doc['_id']:
+                    return
+            buffer.docs.insert(index, doc)
+        else:
+            buffer.docs.append(doc)
+        buffer.bytes += _message_bytes(doc)
+        self.bytes += _message_bytes(doc)
+        if len(buffer.docs) > self.size:
+            dropped = _message_bytes(buffer.docs.popleft())
+            buffer.bytes -= dropped
+            self.bytes -= dropped
+            buffer.complete = False
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._rooms) > 1:
+            _, buffer = self._rooms.popitem(last=False)
+            self.bytes -= buffer.bytes
+
+    def append(self, room, doc):
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is None:
+                buffer = self._rooms[room] = RoomBuffer()
+            self._push(buffer, doc)
+            self._rooms.move_to_end(room)
+            self._evict()
+
+    def load(self, room, docs, complete):
+        """Seed a room from a query result that runs up to its newest message."""
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is not None:
+                # Merge rather than replace, in case a send landed while the query ran
+                self.bytes -= buffer.bytes
+                complete = complete or buffer.complete
+                merged = {doc['_id']: doc for doc in list(docs) + list(buffer.docs)}
+                docs = sorted(merged.values(), key=message_position)
+            buffer = self._rooms[room] = RoomBuffer()
+            buffer.complete = complete
+            for doc in docs:
+                self._push(buffer, doc)
+            self._rooms.move_to_end(room)
+            self._evict()
+
+    def _window(self, room):
+        """A consistent copy of a room's buffer, counting the lookup in the LRU order."""
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is None or not buffer.docs:
+                return [], False
+            self._rooms.move_to_end(room)
+            return list(buffer.docs), buffer.complete
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def discard(self, room, message_id):
+        """Drop one buffered message, e.g. a resend the store already had under another id."""
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is None:
+                return
+            for index, doc in enumerate(buffer.docs):
+                if doc['_id'] == message_id:
+                    del buffer.docs[index]
+                    buffer.bytes -= _message_bytes(doc)
+                    self.bytes -= _message_bytes(doc)
+                    return
+
+    def find(self, room, message_id):
+        docs, _ = self._window(room)
+        for doc in docs:
+            if doc['_id'] == message_id:
+                return doc
+        return None
+
+    def page(self, room, limit, before=None, after=None):
+        """Same as query_history_page(), or None if the buffer may not hold the whole page."""
+        docs, complete = self._window(room)
+        result = None
+        if docs and after is not None:
+            if after >= message_position(docs[0]):
+                newer = [doc for doc in docs if message_position(doc) > after]
+                result = newer[:limit], len(newer) > limit
+        elif docs:
+            older = docs if before is None else [doc for doc in docs if message_position(doc) < before]
+            # One extra message proves there is more; a complete buffer proves there isn't
+            if len(older) > limit or complete:
+                result = older[-limit:], len(older) > limit
+        self._count(result is not None)
+        return result
+
+    def everything(self, room):
+        """The whole conversation, or None unless the buffer is known to hold all of it."""
+        docs, complete = self._window(room)
+        self._count(complete)
+        return docs if complete else None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'rooms': len(self._rooms),
+                'messages': sum(len(buffer.docs) for buffer in self._rooms.values()),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'messages_per_room': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+room_cache = RoomMessageCache(ROOM_BUFFER_SIZE, ROOM_CACHE_MAX_BYTES)
+
+def update_conversations(docs):
+    """Fold newly stored messages into their conversation summaries, one update per conversation.
+
+    Summaries are advisory, so a failure is logged rather than failing the write.
+    """
+    try:
+        summaries = {}
+        for doc in docs:
+            summary = summaries.setdefault(doc['conversation_id'], {
+                'conversation_id': doc['conversation_id'],
+                'participants': sorted({str(doc['sender_id']), str(doc['receiver_id'])}),
+                'last': doc,
+                'unread': {},
+            })
+            if message_position(doc) > message_position(summary['last']):
+                summary['last'] = doc
+            receiver = str(doc['receiver_id'])
+            summary['unread'][receiver] = summary['unread'].get(receiver, 0) + 1
+        message_store.update_conversations(list(summaries.values()))
+    except Exception as e:
+        logger.error(f"Error updating conversation summaries for {len(docs)} messages: {str(e)}")
+
+class MessageWriter:
+    """Persists chat messages in the background, grouped into batched writes.
+
+    Messages get their _id before being queued, so retrying a batch that partly
+    reached the store is idempotent: copies already stored are skipped by the store
+    and counted as written. When the queue is full, submit() falls back to writing
+    the message itself rather than dropping it. stop() drains the batch being
+    written and the queue on shutdown.
+    """
+
+    def __init__(self, batch_size, flush_interval, max_queued):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._started = False
+        self._stopping = False
+        # The batch taken off the queue and not yet fully written
+        self._in_flight = []
+        self._lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.direct_writes = 0
+
+    def start(self):
+        with self._lock:
+            if not self._started:
+                self._started = True
+                socketio.start_background_task(self.run)
+
+    def submit(self, doc):
+        if self._stopping:
+            self._persist([doc], attempts=3)
+            return
+        try:
+            self._queue.put(doc, timeout=self.flush_interval)
+        except queue.Full:
+            logger.warning("Message write queue is full, writing message directly")
+            self.direct_writes += 1
+            self._persist([doc], attempts=3)
+
+    def _write(self, docs):
+        """One batched write; returns the documents that still need writing."""
+        try:
+            inserted, failed = message_store.insert_messages(docs)
+        except Exception as e:
+            logger.error(f"Error writing {len(docs)} messages to the message store: {str(e)}")
+            inserted, failed = [], docs
+        self.written += len(docs) - len(failed)
+        self.batches += 1
+        # Copies an earlier attempt (or a resend) already stored updated their conversation then
+        if inserted:
+            update_conversations(inserted)
+        written = {id(doc) for doc in inserted + failed}
+        drop_resent_copies([doc for doc in docs if id(doc) not in written])
+        return failed
+
+    def _persist(self, docs, attempts=None):
+        """Write docs, retrying with backoff; gives up after `attempts` tries if given."""
+        attempt = 0
+        while docs:
+            docs = self._write(docs)
+            attempt += 1
+            if not docs:
+                return True
+            if attempts is not None and attempt >= attempts:
+                logger.error(f"Giving up on {len(docs)} messages after {attempt} attempts")
+                return False
+            self.retries += 1
+            socketio.sleep(min(MESSAGE_RETRY_MAX_DELAY, 0.1 * 2 ** attempt))
+        return True
+
+    def _next_batch(self):
+        """Wait for a message, then gather more until the batch is full or flush_interval passes."""
+        try:
+            batch = self._in_flight = [self._queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        logger.info("Message writer started")
+        while not self._stopping:
+            batch = self._next_batch()
+            if batch:
+                self._persist(batch)
+            self._in_flight = []
+
+    def flush(self):
+        """Synchronously write whatever is still queued, e.g. on shutdown."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._persist(batch, attempts=3)
+                batch = []
+        if batch:
+            self._persist(batch, attempts=3)
+
+    def stop(self):
+        """Stop the background writer and synchronously write its in-flight batch and the queue.
+
+        The in-flight batch may be half written, or still being written by run(); writing
+        it again is harmless, as copies already stored are skipped.
+        """
+        self._stopping = True
+        in_flight, self._in_flight = self._in_flight, []
+        if in_flight:
+            self._persist(in_flight, attempts=3)
+        self.flush()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'retries': self.retries,
+            'direct_writes': self.direct_writes,
+        }
+
+message_writer = MessageWriter(MESSAGE_BATCH_SIZE, MESSAGE_FLUSH_INTERVAL, MESSAGE_QUEUE_MAX)
+atexit.register(message_writer.stop)
+
+def handle_sigterm(signum, frame):
+    """SIGTERM (docker stop, systemd, Kubernetes) skips atexit, so drain the message writer first."""
+    logger.info("SIGTERM received, writing queued chat messages before exiting")
+    message_writer.stop()
+    sys.exit(0)
+
+class RecentMessageIds:
+    """LRU of recently accepted (sender_id, client_msg_id) pairs and the message they created.
+
+    A resend is normally caught here, or else found in the message store before it is
+    delivered. One that slips past both (its original is still queued on another
+    worker) collides with the unique (sender_id, client_msg_id) index when written
+    and is then dropped from the room cache, so it never reaches history twice.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def get(self, sender_id, client_msg_id):
+        """The message already accepted for this id, if it is still remembered."""
+        key = (sender_id, client_msg_id)
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                self._entries.move_to_end(key)
+                self.duplicates += 1
+            return existing
+
+    def remember_original(self, sender_id, client_msg_id, doc):
+        """Record doc, found in the message store, as the original of a resend of this id."""
+        with self._lock:
+            self.duplicates += 1
+            self._entries[(sender_id, client_msg_id)] = doc
+            self._entries.move_to_end((sender_id, client_msg_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def claim(self, sender_id, client_msg_id, doc):
+        """Record doc as the message for this id; returns the earlier message if there was one."""
+        key = (sender_id, client_msg_id)
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                self._entries.move_to_end(key)
+                self.duplicates += 1
+                return existing
+            self._entries[key] = doc
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'duplicates_rejected': self.duplicates}
+
+recent_message_ids = RecentMessageIds(RECENT_MESSAGE_IDS)
+
+def stored_resend(sender_id, client_msg_id):
+    """The stored message for a client_msg_id this worker no longer remembers (or never saw)."""
+    try:
+        stored = message_store.find_by_client_id(sender_id, client_msg_id)
+    except Exception as e:
+        # The unique index still keeps a resend out of the store
+        logger.error(f"Error looking up client message {client_msg_id}: {str(e)}")
+        return None
+    if stored is not None:
+        recent_message_ids.remember_original(sender_id, client_msg_id, stored)
+    return stored
+
+def drop_resent_copies(docs):
+    """Take messages the store refused as resends of an already stored client_msg_id out of the room cache."""
+    for doc in docs:
+        if not doc.get('client_msg_id'):
+            continue
+        try:
+            stored = message_store.find_by_client_id(doc['sender_id'], doc['client_msg_id'])
+        except Exception as e:
+            logger.error(f"Error looking up client message {doc['client_msg_id']}: {str(e)}")
+            continue
+        if stored is not None and stored['_id'] != doc['_id']:
+            logger.info(f"Message {doc['_id']} resent {doc['client_msg_id']}, stored as {stored['_id']}; dropping it")
+            room_cache.discard(doc['conversation_id'], doc['_id'])
+            recent_message_ids.remember_original(doc['sender_id'], doc['client_msg_id'], stored)
+
+def message_ack(doc, duplicate=False):
+    """Acknowledgement returned to the sender of a message."""
+    return {
+        'client_msg_id': doc.get('client_msg_id'),
+        'id': str(doc['_id']),
+        'timestamp': doc['timestamp'],
+        'duplicate': duplicate,
+    }
+
+def remember_remote_message(room, payload):
+    """Put a message another worker emitted into this worker's room cache."""
+    try:
+        doc = {field: payload.get(field) for field in MESSAGE_FIELDS}
+        doc.update(_id=ObjectId(payload['id']), ts=parse_timestamp(payload['ts']), conversation_id=room)
+    except (KeyError, TypeError, InvalidId):
+        return
+    if room and doc['ts'] is not None:
+        room_cache.append(room, doc)
+
+def resolve_last_seen(room, last_seen):
+    """Turn a client's last_seen (a message id or an ISO timestamp) into a history position."""
+    if ObjectId.is_valid(str(last_seen)):
+        message_id = ObjectId(str(last_seen))
+        doc = room_cache.find(room, message_id) or message_store.find_message(room, message_id)
+        return message_position(doc) if doc else None
+    ts = parse_timestamp(last_seen)
+    # Everything stored at or before that instant counts as seen
+    return (ts, _MAX_OBJECT_ID) if ts else None
+
+def missed_messages(room, position):
+    """Messages after position, capped at one history page, plus the cursor to continue from."""
+    messages, has_more, (_, newest) = history_page(room, CHAT_HISTORY_MAX_PAGE, after=position)
+    return messages, has_more, newest
+
+def ensure_message_indexes(raise_errors=False):
+    """Create the message store's tables/indexes (idempotent), migrating legacy data first.
+
+    Failures are logged and swallowed at server startup, so the rest of the app still
+    comes up; raise_errors re-raises them for callers that must not carry on.
+    """
+    try:
+        started = time.monotonic()
+        message_store.ensure_schema()
+        logger.info(f"Message store ready in {time.monotonic() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"Error creating message indexes: {str(e)}")
+        if raise_errors:
+            raise
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Bootstrap the message store's indexes, e.g. before a deploy: flask --app app ensure-indexes"""
+    try:
+        ensure_message_indexes(raise_errors=True)
+    except Exception as e:
+        # Exit non-zero so a deploy step running this stops here
+        raise click.ClickException(f"Could not create message indexes: {e}")
+
+# -------------------------------------------------
+# Message stores
+# -------------------------------------------------
+
+class MessageStore(ABC):
+    """Where chat messages and conversation summaries are persisted.
+
+    Messages are dicts with an ObjectId _id, a naive UTC datetime ts, their
+    conversation_id and the MESSAGE_FIELDS; history order is (ts, _id).
+    """
+
+    @abstractmethod
+    def ensure_schema(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_messages(self, docs):
+        """Store a batch; returns (inserted, failed).
+
+        Messages already stored, by _id or by (sender_id, client_msg_id), are in
+        neither list.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def history(self, conversation, limit, before=None, after=None):
+        """Up to limit + 1 messages in history order, next to a (ts, _id) position.
+
+        Without a position these are the newest messages; otherwise the ones just
+        before `before` or just after `after`. The extra message, if any, is the
+        first one beyond the page.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def all_messages(self, conversation):
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_message(self, conversation, message_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_by_client_id(self, sender_id, client_msg_id):
+        """The stored message a sender sent with this client_msg_id, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_conversations(self, summaries):
+        """Apply summaries from update_conversations(): new last message, unread increments."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def conversations(self, user, limit):
+        """A user's conversations, most recent first, as dicts with conversation_id,
+        participants, last_message and the user's unread count."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def mark_read(self, conversation, user):
+        raise NotImplementedError
+
+DUPLICATE_KEY = 11000
+
+class MongoMessageStore(MessageStore):
+    """Messages and conversation summaries in the people_chat MongoDB database."""
+
+    def __init__(self, get_client, database='people_chat'):
+        # Resolved on each use, so no connection is made until chat is used
+        self._get_client = get_client
+        self.database = database
+
+    @property
+    def messages(self):
+        return self._get_client()[self.database]['messages']
+
+    @property
+    def conversations_collection(self):
+        # One summary per conversation (last message, unread counts)
+        return self._get_client()[self.database]['conversations']
+
+    def ensure_schema(self):
+        self._backfill_message_keys()
+        # _id breaks ties between messages stored in the same millisecond
+        self.messages.create_index(
+            [('conversation_id', ASCENDING), ('ts', ASCENDING), ('_id', ASCENDING)],
+            name='conversation_ts')
+        # Partial, so the many messages without a client id don't collide on null
+        self.messages.create_index(
+            [('sender_id', ASCENDING), ('client_msg_id', ASCENDING)],
+            name='sender_client_msg_id', unique=True,
+            partialFilterExpression={'client_msg_id': {'$type': 'string'}})
+        self._backfill_conversations()
+        # A user's inbox, most recent first
+        self.conversations_collection.create_index(
+            [('participants', ASCENDING), ('last_ts', DESCENDING)], name='participant_last_ts')
+
+    def _backfill_message_keys(self, batch_size=1000):
+        """Give messages stored before conversation_id/ts existed their keys."""
+        updates = []
+        updated = 0
+        legacy = self.messages.find({'conversation_id': {'$exists': False}},
+                                    {'sender_id': 1, 'receiver_id': 1, 'timestamp': 1})
+        for doc in legacy:
+            ts = parse_timestamp(doc.get('timestamp')) or doc['_id'].generation_time.replace(tzinfo=None)
+            updates.append(UpdateOne({'_id': doc['_id']}, {'$set': {
+                'conversation_id': conversation_id(doc.get('sender_id'), doc.get('receiver_id')),
+                'ts': ts,
+            }}))
+            if len(updates) >= batch_size:
+                updated += self.messages.bulk_write(updates, ordered=False).modified_count
+                updates = []
+        if updates:
+            updated += self.messages.bulk_write(updates, ordered=False).modified_count
+        if updated:
+            logger.info(f"Backfilled conversation keys on {updated} messages")
+
+    def _backfill_conversations(self):
+        """Build summaries for conversations that predate the conversations collection."""
+        if self.conversations_collection.estimated_document_count() or not self.messages.estimated_document_count():
+            return
+        latest = self.messages.aggregate([
+            {'$sort': {'conversation_id': 1, 'ts': 1, '_id': 1}},
+            {'$group': {'_id': '$conversation_id', 'last': {'$last': '$$ROOT'}}},
+        ], allowDiskUse=True)
+        updates = [UpdateOne({'_id': row['_id']}, {'$setOnInsert': {
+            'participants': sorted({str(row['last']['sender_id']), str(row['last']['receiver_id'])}),
+            'last_message': client_message(row['last']),
+            'last_ts': row['last']['ts'],
+            'unread': {},
+        }}, upsert=True) for row in latest]
+        if updates:
+            self.conversations_collection.bulk_write(updates, ordered=False)
+            logger.info(f"Built summaries for {len(updates)} existing conversations")
+
+    def insert_messages(self, docs):
+        failed_at, duplicate_at = set(), set()
+        try:
+            self.messages.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                (duplicate_at if error.get('code') == DUPLICATE_KEY else failed_at).add(error['index'])
+        inserted = [doc for i, doc in enumerate(docs) if i not in failed_at and i not in duplicate_at]
+        return inserted, [docs[i] for i in sorted(failed_at)]
+
+    def history(self, conversation, limit, before=None, after=None):
+        # A bounded range scan of the (conversation_id, ts, _id) index
+        query = {'conversation_id': conversation}
+        anchor, op, order = (before, '$lt', DESCENDING) if after is None else (after, '$gt', ASCENDING)
+        if anchor is not None:
+            ts, oid = anchor
+            query['$or'] = [{'ts': {op: ts}}, {'ts': ts, '_id': {op: oid}}]
+        docs = list(self.messages.find(query, MESSAGE_PROJECTION)
+                    .sort([('ts', order), ('_id', order)])
+                    .limit(limit + 1))
+        if order == DESCENDING:
+            docs.reverse()
+        return docs
+
+    def all_messages(self, conversation):
+        return list(self.messages.find({'conversation_id': conversation}, MESSAGE_PROJECTION).sort(HISTORY_SORT))
+
+    def find_message(self, conversation, message_id):
+        return self.messages.find_one({'_id': message_id, 'conversation_id': conversation}, MESSAGE_PROJECTION)
+
+    def find_by_client_id(self, sender_id, client_msg_id):
+        # $type repeats the partial filter of the sender_client_msg_id index, so it can be used
+        return self.messages.find_one({'sender_id': sender_id,
+                                       'client_msg_id': {'$eq': client_msg_id, '$type': 'string'}},
+                                      MESSAGE_PROJECTION)
+
+    def update_conversations(self, summaries):
+        self.conversations_collection.bulk_write([UpdateOne(
+            {'_id': summary['conversation_id']}, self._summary_update(summary), upsert=True
+        ) for summary in summaries], ordered=False)
+
+    @staticmethod
+    def _summary_update(summary):
+        """Pipeline update that only moves last_message forward, as the SQLite store does.
+
+        A batch retried late, or written by another worker, may carry an older last
+        message than the one already stored; its unread counts still apply.
+        """
+        last_ts = summary['last']['ts']
+        newer = {'$gte': [last_ts, {'$ifNull': ['$last_ts', _EPOCH]}]}
+        fields = {
+            # $literal, so message text starting with '$' isn't read as a field path
+            'participants': {'$ifNull': ['$participants', {'$literal': summary['participants']}]},
+            'last_message': {'$cond': [newer, {'$literal': client_message(summary['last'])}, '$last_message']},
+            'last_ts': {'$cond': [newer, last_ts, '$last_ts']},
+        }
+        for user, count in summary['unread'].items():
+            fields[f'unread.{user}'] = {'$add': [{'$ifNull': [f'$unread.{user}', 0]}, count]}
+        return [{'$set': fields}]
+
+    def conversations(self, user, limit):
+        cursor = self.conversations_collection.find(
+            {'participants': user},
+            {'participants': 1, 'last_message': 1, f'unread.{user}': 1}
+        ).sort('last_ts', DESCENDING).limit(limit)
+        return [{
+            'conversation_id': summary['_id'],
+            'participants': summary['participants'],
+            'last_message': summary.get('last_message'),
+            'unread': summary.get('unread', {}).get(user, 0),
+        } for summary in cursor]
+
+    def mark_read(self, conversation, user):
+        self.conversations_collection.update_one({'_id': conversation}, {'$set': {f'unread.{user}': 0}})
+
+class SqliteMessageStore(MessageStore):
+    """Messages and conversation summaries in a local SQLite file, for deployments without Mongo.
+
+    The database runs in WAL mode so history reads don't wait on the message writer,
+    and each batch from the writer is a single transaction.
+    """
+
+    _COLUMNS = ('id', 'conversation_id', 'ts') + MESSAGE_FIELDS
+
+    def __init__(self, path):
+        self.path = path
+        self.ensure_schema()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def ensure_schema(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS messages (
+                                id TEXT PRIMARY KEY,         -- ObjectId hex, orders like the ObjectId
+                                conversation_id TEXT NOT NULL,
+                                ts INTEGER NOT NULL,         -- milliseconds since the epoch, UTC
+                                sender_id TEXT,
+                                receiver_id TEXT,
+                                message TEXT,
+                                timestamp TEXT,
+                                client_msg_id TEXT)""")
+            conn.execute("""CREATE INDEX IF NOT EXISTS messages_conversation_ts
+                            ON messages (conversation_id, ts, id)""")
+            conn.execute("""CREATE UNIQUE INDEX IF NOT EXISTS messages_sender_client_msg_id
+                            ON messages (sender_id, client_msg_id) WHERE client_msg_id IS NOT NULL""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS conversations (
+                                conversation_id TEXT PRIMARY KEY,
+                                participants TEXT NOT NULL,  -- JSON list
+                                last_message TEXT,           -- JSON, as sent to clients
+                                last_ts INTEGER)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS conversation_members (
+                                user_id TEXT NOT NULL,
+                                conversation_id TEXT NOT NULL,
+                                unread INTEGER NOT NULL DEFAULT 0,
+                                last_ts INTEGER,
+                                PRIMARY KEY (user_id, conversation_id))""")
+            conn.execute("""CREATE INDEX IF NOT EXISTS conversation_members_inbox
+                            ON conversation_members (user_id, last_ts DESC)""")
+
+    @staticmethod
+    def _millis(ts):
+        return (ts - _EPOCH) // timedelta(milliseconds=1)
+
+    def _row(self, doc):
+        return (str(doc['_id']), doc['conversation_id'], self._millis(doc['ts'])) + \
+            tuple(doc.get(field) for field in MESSAGE_FIELDS)
+
+    def _doc(self, row):
+        doc = dict(zip(self._COLUMNS, row))
+        doc['_id'] = ObjectId(doc.pop('id'))
+        doc['ts'] = _EPOCH + timedelta(milliseconds=doc['ts'])
+        return doc
+
+    def insert_messages(self, docs):
+        inserted = []
+        with self._connect() as conn:
+            for doc in docs:
+                # Ignored rows are copies already stored under the same id or client id
+                cursor = conn.execute(
+                    f"INSERT OR IGNORE INTO messages ({', '.join(self._COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(self._COLUMNS))})", self._row(doc))
+                if cursor.rowcount:
+                    inserted.append(doc)
+        return inserted, []
+
+    def history(self, conversation, limit, before=None, after=None):
+        select = f"SELECT {', '.join(self._COLUMNS)} FROM messages WHERE conversation_id = ?"
+        params = [conversation]
+        if after is not None:
+            select += " AND (ts, id) > (?, ?) ORDER BY ts, id LIMIT ?"
+            params += [self._millis(after[0]), str(after[1])]
+        elif before is not None:
+            select += " AND (ts, id) < (?, ?) ORDER BY ts DESC, id DESC LIMIT ?"
+            params += [self._millis(before[0]), str(before[1])]
+        else:
+            select += " ORDER BY ts DESC, id DESC LIMIT ?"
+        with self._connect() as conn:
+            docs = [self._doc(row) for row in conn.execute(select, params + [limit + 1])]
+        if after is None:
+            docs.reverse()
+        return docs
+
+    def all_messages(self, conversation):
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM messages "
+                                "WHERE conversation_id = ? ORDER BY ts, id", (conversation,)).fetchall()
+        return [self._doc(row) for row in rows]
+
+    def find_message(self, conversation, message_id):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM messages "
+                               "WHERE id = ? AND conversation_id = ?", (str(message_id), conversation)).fetchone()
+        return self._doc(row) if row else None
+
+    def find_by_client_id(self, sender_id, client_msg_id):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM messages "
+                               "WHERE sender_id = ? AND client_msg_id = ?", (sender_id, client_msg_id)).fetchone()
+        return self._doc(row) if row else None
+
+    def update_conversations(self, summaries):
+        with self._connect() as conn:
+            for summary in summaries:
+                last_ts = self._millis(summary['last']['ts'])
+                conn.execute("""INSERT INTO conversations (conversation_id, participants, last_message, last_ts)
+                                VALUES (?, ?, ?, ?)
+                                ON CONFLICT (conversation_id) DO UPDATE SET
+                                    last_message = excluded.last_message, last_ts = excluded.last_ts
+                                WHERE excluded.last_ts >= conversations.last_ts""",
+                             (summary['conversation_id'], json.dumps(summary['participants']),
+                              json.dumps(client_message(summary['last'])), last_ts))
+                for user in summary['participants']:
+                    conn.execute("""INSERT INTO conversation_members (user_id, conversation_id, unread, last_ts)
+                                    VALUES (?, ?, ?, ?)
+                                    ON CONFLICT (user_id, conversation_id) DO UPDATE SET
+                                        unread = unread + excluded.unread,
+                                        last_ts = MAX(last_ts, excluded.last_ts)""",
+                                 (user, summary['conversation_id'], summary['unread'].get(user, 0), last_ts))
+
+    def conversations(self, user, limit):
+        with self._connect() as conn:
+            rows = conn.execute("""SELECT c.conversation_id, c.participants, c.last_message, m.unread
+                                   FROM conversation_members m JOIN conversations c USING (conversation_id)
+                                   WHERE m.user_id = ? ORDER BY m.last_ts DESC LIMIT ?""", (user, limit)).fetchall()
+        return [{
+            'conversation_id': conversation,
+            'participants': json.loads(participants),
+            'last_message': json.loads(last_message) if last_message else None,
+            'unread': unread,
+        } for conversation, participants, last_message, unread in rows]
+
+    def mark_read(self, conversation, user):
+        with self._connect() as conn:
+            conn.execute("UPDATE conversation_members SET unread = 0 WHERE user_id = ? AND conversation_id = ?",
+                         (user, conversation))
+
+MESSAGE_STORES = {
+    'mongo': lambda: MongoMessageStore(get_mongo_client),
+    'sqlite': lambda: SqliteMessageStore(MESSAGE_DB_PATH),
+}
+
+if MESSAGE_STORE not in MESSAGE_STORES:
+    raise ValueError(f"Unknown MESSAGE_STORE: {MESSAGE_STORE} (expected one of {', '.join(MESSAGE_STORES)})")
+message_store = MESSAGE_STORES[MESSAGE_STORE]()
+
 # -------------------------------------------------
 # Routes
 # -------------------------------------------------
 
+@app.after_request
+def add_staleness_headers(response):
+    """Tell clients how old the directory data behind a response is."""
+    snapshot = g.get('people_snapshot')
+    if snapshot is not None:
+        age = snapshot.age()
+        response.headers['X-Snapshot-Age'] = f'{age:.0f}'
+        if age >= PEOPLE_CACHE_TTL:
+            response.headers['Warning'] = '110 - "Response is Stale"'
+    return response
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -150,7 +2885,7 @@ def index():
 def get_organizations():
     logger.info("HIT /api/organizations")
     try:
-        all_people = fetch_people_data()
+        all_people = current_people_snapshot().people
         logger.info(f"Fetched {len(all_people)} people")
         organizations = sorted(list(set(
             person['organization'] 
@@ -170,27 +2905,22 @@ def search_people():
         org = request.args.get("organization", "").strip()
         logger.info(f"Search query received: q='{q}', organization='{org}'")
 
-        # Fetch all people from Google Sheets
-        all_people = fetch_people_data()
-        logger.info(f"Fetched {len(all_people)} total records")
+        # Search the directory snapshot through its organization and text indexes
+        snapshot = current_people_snapshot()
+        logger.info(f"Fetched {len(snapshot.people)} total records")
         
         # Filter based on search query and organization
-        results = all_people
+        rows = range(len(snapshot.people))
         
         if org:
-            results = [p for p in results if p['organization'] and p['organization'].lower() == org.lower()]
-            logger.info(f"Filtered to {len(results)} records after organization filter")
+            rows = snapshot.org_index.get(org.lower(), [])
+            logger.info(f"Filtered to {len(rows)} records after organization filter")
 
         if q:
-            results = [
-                p for p in results
-                if (q in (p['name'] or '').lower() or 
-                    q in (p['organization'] or '').lower() or
-                    q in (p['role'] or '').lower() or
-                    q in (p['email'] or '').lower())
-            ]
-            logger.info(f"Filtered to {len(results)} records after text search")
+            rows = [r for r in rows if q in snapshot.search_text[r]]
+            logger.info(f"Filtered to {len(rows)} records after text search")
 
+        results = [snapshot.people[r] for r in rows]
         return jsonify(results)
 
     except Exception as e:
@@ -206,24 +2936,20 @@ def nearby_people():
         org = request.args.get("organization", "").strip()
         logger.info(f"Nearby search request: lat={lat}, lon={lon}, radius={radius_km}km, organization='{org}'")
 
-        all_people = fetch_people_data()
-        
-        # First filter by organization if specified
-        if org:
-            all_people = [p for p in all_people if p['organization'] and p['organization'].lower() == org.lower()]
-            logger.info(f"Filtered to {len(all_people)} records after organization filter")
+        if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+            snapshot = current_people_snapshot()
+            return Response(stream_nearby(snapshot, snapshot.geo_partition(org), lat, lon, radius_km),
+                            mimetype='application/x-ndjson')
 
-        nearby = []
-        for person in all_people:
-            if person['latitude'] and person['longitude']:
-                dist = haversine_distance(lat, lon, person['latitude'], person['longitude'])
-                if dist <= radius_km:
-                    person_copy = person.copy()
-                    person_copy['distance_km'] = round(dist, 2)
-                    nearby.append(person_copy)
+        # Only the organization's partition is scanned when one is given
+        snapshot = current_people_snapshot()
+        partition = snapshot.geo_partition(org)
+        positions = nearby_candidates(snapshot, partition, lat, lon, radius_km, org)
 
-        # Sort by distance
-        nearby.sort(key=lambda x: x['distance_km'])
+        # Exact distances for the candidates only, sorted nearest first
+        dist = partition.distances(lat, lon, positions)
+        nearby = people_with_distance(snapshot, partition.rows[positions], dist,
+                                      select_nearby(dist, radius_km, None))
         logger.info(f"Found {len(nearby)} people within {radius_km}km")
         
         return jsonify(nearby)
@@ -235,6 +2961,37 @@ def nearby_people():
         logger.error(f"Error in nearby search: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/nearby/batch", methods=['POST'])
+def nearby_people_batch():
+    """Run many nearby queries in one call.
+
+    Body: a list (or {"queries": [...]}) of {lat, lon, radius | k, organization}.
+    Returns {"results": [...]} with one distance-sorted list per query, in input order.
+    """
+    try:
+        data = request.get_json(silent=True)
+        queries = data.get('queries') if isinstance(data, dict) else data
+        if not isinstance(queries, list):
+            return jsonify({'error': 'Expected a list of queries'}), 400
+        if len(queries) > NEARBY_BATCH_MAX:
+            return jsonify({'error': f'At most {NEARBY_BATCH_MAX} queries per batch'}), 400
+
+        parsed = []
+        for i, query in enumerate(queries):
+            try:
+                parsed.append(parse_nearby_query(query))
+            except (KeyError, ValueError, TypeError) as e:
+                logger.error(f"Invalid query {i} in nearby batch: {str(e)}")
+                return jsonify({'error': f'query {i}: {str(e)}'}), 400
+        logger.info(f"Nearby batch request: {len(parsed)} queries")
+
+        results = batch_nearby(current_people_snapshot(), parsed)
+        return jsonify({'results': results})
+
+    except Exception as e:
+        logger.error(f"Error in nearby batch search: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/submit', methods=['POST'])
 def submit_user():
     """Handle user submission."""
@@ -242,74 +2999,155 @@ def submit_user():
         data = request.json
         logger.info("Received user submission request")
         
-        # Validate required fields
-        required_fields = ['name', 'email', 'organization']
-        for field in required_fields:
-            if not data.get(field):
-                logger.error(f"Missing required field: {field}")
-                return jsonify({'error': f'{field} is required'}), 400
-
-        # Get the Google Sheets service
-        service = get_google_sheets_service()
-        if not service:
-            logger.error("Failed to create Google Sheets service")
-            return jsonify({'error': 'Internal server error'}), 500
+        # Validate required fields and coordinates
+        error = validate_submission(data)
+        if error:
+            logger.error(f"Invalid submission: {error}")
+            return jsonify({'error': error}), 400
 
-        # Get the next available row
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range=RANGE_NAME
-        ).execute()
-        values = result.get('values', [])
-        next_row = len(values) + 2  # +2 because we start from A2
+        email = normalize_email(data['email'])
+        with submission_locks.hold(email):
+            # A known email turns the submission into an update of that person's row
+            snapshot = current_people_snapshot()
+            existing = snapshot.email_index.get(email)
+            if existing is not None:
+                person_id = snapshot.people[existing]['id']
+                row = submission_row(person_id, data)
+                sheet_queue.enqueue_update(row)
+                ensure_sheet_writer()
+                apply_updated_row(row)
+                logger.info(f"Queued update of user {person_id} for the sheet")
+                return jsonify({'message': 'Successfully updated user data', 'id': str(person_id), 'updated': True}), 202
 
-        # If organization is "other", use the new_organization value
-        organization = data.get('new_organization') if data.get('organization') == 'other' else data.get('organization')
-        
-        # Prepare row data
-        row_data = [
-            [
-                str(next_row - 2),  # ID (row number - 2)
-                data.get('name', ''),
-                data.get('photo_url', ''),
-                data.get('phone', ''),
-                data.get('email', ''),
-                str(data.get('latitude', '')),
-                str(data.get('longitude', '')),
-                organization,
-                data.get('role', '')
-            ]
-        ]
-
-        # Update the sheet
-        body = {
-            'values': row_data
-        }
-        
-        result = service.spreadsheets().values().append(
-            spreadsheetId=SPREADSHEET_ID,
-            range=f'Sheet1!A{next_row}',
-            valueInputOption='RAW',
-            insertDataOption='INSERT_ROWS',
-            body=body
-        ).execute()
-
-        logger.info(f"Successfully added user data to row {next_row}")
-        return jsonify({'message': 'Successfully added user data'}), 200
-        
+            if not id_allocator.reconciled:
+                # Get the Google Sheets service
+                service = get_google_sheets_service()
+                if not service:
+                    logger.error("Failed to create Google Sheets service")
+                    return jsonify({'error': 'Internal server error'}), 500
+                reconcile_ids_from_sheet(service)
+
+            person_id = id_allocator.allocate()
+            row = submission_row(person_id, data)
+
+            # Queue the row durably; the sheet writer appends it in the background
+            sheet_queue.enqueue([row])
+            ensure_sheet_writer()
+            apply_submitted_row(row)
+
+        logger.info(f"Queued user {person_id} for the sheet")
+        return jsonify({'message': 'Successfully added user data', 'id': str(person_id)}), 202
+
+    except SheetsUnavailable as e:
+        # Only a fresh state file needs the sheet here, to seed the ID sequence
+        logger.warning(f"Cannot allocate an ID yet: {str(e)}")
+        retry_after = max(1, round(sheets_breaker.retry_in()))
+        return jsonify({'error': 'Google Sheets is unavailable, try again shortly'}), 503, {'Retry-After': str(retry_after)}
     except Exception as e:
         logger.error(f"Error submitting user data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/check_profile_exists')
+@app.route('/api/import', methods=['POST'])
+def import_people():
+    """Start a bulk import of people from a CSV or JSONL upload.
+
+    The upload may be a multipart 'file' field or the raw request body; the format
+    comes from ?format=csv|jsonl, falling back to the file name. CSV headers use the
+    same field names as /api/submit. Returns a job id to poll for progress.
+    """
+    try:
+        upload = request.files.get('file')
+        fmt = request.args.get('format', '').lower()
+        if not fmt and upload and upload.filename:
+            fmt = 'csv' if upload.filename.lower().endswith('.csv') else 'jsonl'
+        if fmt not in ('csv', 'jsonl'):
+            return jsonify({'error': 'format must be csv or jsonl'}), 400
+
+        # Spool the upload to disk so the import runs in bounded memory after the request ends
+        source = upload.stream if upload else request.stream
+        with tempfile.NamedTemporaryFile(prefix='import-', suffix=f'.{fmt}', delete=False) as spool:
+            while True:
+                block = source.read(64 * 1024)
+                if not block:
+                    break
+                spool.write(block)
+
+        job = ImportJob(fmt)
+        register_import_job(job)
+        socketio.start_background_task(run_import, job, spool.name)
+        logger.info(f"Started import {job.id} ({fmt})")
+        return jsonify(job.to_dict()), 202
+
+    except Exception as e:
+        logger.error(f"Error starting import: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/import/<job_id>')
+def import_status(job_id):
+    job = import_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown import job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/export')
+def export_people():
+    """Stream the directory as ndjson, csv or parquet, optionally filtered by organization and bbox."""
+    try:
+        fmt = request.args.get('format', 'ndjson').lower()
+        org = request.args.get('organization', '').strip()
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+        if fmt == 'parquet' and pa is None:
+            return jsonify({'error': 'parquet export requires pyarrow'}), 501
+
+        snapshot = current_people_snapshot()
+        rows = export_rows(snapshot, org, bbox)
+        logger.info(f"Exporting {len(rows)} people as {fmt} (organization='{org}', bbox={bbox})")
+        generate, mimetype = EXPORT_FORMATS[fmt]
+        response = Response(generate(snapshot, rows), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename=people.{fmt}'
+        return response
+
+    except ValueError as e:
+        logger.error(f"Invalid parameters in export: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in export: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/check_profile_exists', methods=['GET', 'POST'])
 def check_profile_exists():
-    """Check if a profile with the given email exists in Google Sheets."""
-    email = request.args.get('email', '').strip().lower()
-    if not email:
+    """Check if profiles with the given emails exist in the directory.
+
+    A single ?email= returns {'exists': bool}. Several emails (repeated ?email=,
+    comma-separated ?emails= or a JSON body {"emails": [...]}) return
+    {'results': {email: bool}}. Lookups use the snapshot's email index, never Sheets.
+    """
+    emails = request.args.getlist('email')
+    if request.args.get('emails'):
+        emails += request.args['emails'].split(',')
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        data = {} if data is None else data
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        body_emails = data.get('emails') or []
+        if not isinstance(body_emails, list) or not all(isinstance(email, str) for email in body_emails):
+            return jsonify({'error': 'emails must be a list of strings'}), 400
+        emails += body_emails
+    emails = [normalize_email(email) for email in emails if normalize_email(email)]
+    if not emails:
         return jsonify({'error': 'Email is required'}), 400
-    people = fetch_people_data()
-    exists = any(p['email'] and p['email'].strip().lower() == email for p in people)
-    return jsonify({'exists': exists})
+    if len(emails) > PROFILE_CHECK_BATCH_MAX:
+        return jsonify({'error': f'At most {PROFILE_CHECK_BATCH_MAX} emails per call'}), 400
+
+    snapshot = current_people_snapshot()
+    profile_check_stats['lookups'] += len(emails)
+    results = {email: snapshot.has_email(email) for email in emails}
+    if len(emails) == 1 and request.method == 'GET' and 'emails' not in request.args:
+        return jsonify({'exists': results[emails[0]]})
+    return jsonify({'results': results})
 
 @app.route('/api/chat_history')
 def chat_history():
@@ -318,21 +3156,106 @@ def chat_history():
     user2 = request.args.get('user2')
     if not user1 or not user2:
         return jsonify({'error': 'Both user1 and user2 IDs are required'}), 400
-    # Find messages where (sender==user1 and receiver==user2) or vice versa
-    query = {
-        '$or': [
-            {'sender_id': user1, 'receiver_id': user2},
-            {'sender_id': user2, 'receiver_id': user1}
-        ]
-    }
-    msgs = list(messages_collection.find(query, {'_id': 0}))
-    msgs.sort(key=lambda x: x.get('timestamp', ''))
-    return jsonify(msgs)
+    conversation = conversation_id(user1, user2)
+    if not any(request.args.get(param) for param in ('limit', 'before', 'after')):
+        # Legacy clients: the whole conversation as a plain list
+        return jsonify(full_history(conversation))
+
+    try:
+        limit = int(request.args.get('limit', CHAT_HISTORY_PAGE_SIZE))
+        before = request.args.get('before')
+        after = request.args.get('after')
+        if before and after:
+            raise ValueError('Pass either before or after, not both')
+        before = parse_message_cursor(before) if before else None
+        after = parse_message_cursor(after) if after else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not 1 <= limit <= CHAT_HISTORY_MAX_PAGE:
+        return jsonify({'error': f'limit must be between 1 and {CHAT_HISTORY_MAX_PAGE}'}), 400
+
+    messages, has_more, (oldest, newest) = history_page(conversation, limit, before, after)
+    return jsonify({
+        'messages': messages,
+        'has_more': has_more,
+        'before': oldest,  # pass as ?before= to load the previous (older) page
+        'after': newest,   # pass as ?after= to load messages newer than this page
+    })
+
+def valid_user_id(user_id):
+    # User ids become field names in the unread counters
+    return isinstance(user_id, str) and bool(user_id) and '.' not in user_id and not user_id.startswith('$')
+
+@app.route('/api/conversations')
+def conversations():
+    """A user's conversations, most recently active first, with unread counts."""
+    user = request.args.get('user')
+    if not valid_user_id(user):
+        return jsonify({'error': 'A valid user ID is required'}), 400
+    try:
+        limit = int(request.args.get('limit', CHAT_HISTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 1 <= limit <= CHAT_HISTORY_MAX_PAGE:
+        return jsonify({'error': f'limit must be between 1 and {CHAT_HISTORY_MAX_PAGE}'}), 400
+
+    results = []
+    for summary in message_store.conversations(user, limit):
+        others = [p for p in summary['participants'] if p != user]
+        results.append({
+            'conversation_id': summary['conversation_id'],
+            'other_user': others[0] if others else user,
+            'last_message': summary['last_message'],
+            'unread': summary['unread'],
+        })
+    return jsonify({'conversations': results, 'unread_total': sum(c['unread'] for c in results)})
+
+@app.route('/api/conversations/read', methods=['POST'])
+def mark_conversation_read():
+    """Reset a user's unread counter for one conversation."""
+    data = request.get_json(silent=True) or {}
+    user = str(data.get('user') or '')
+    other = str(data.get('other') or '')
+    if not valid_user_id(user) or not other:
+        return jsonify({'error': 'Both user and other IDs are required'}), 400
+    message_store.mark_read(conversation_id(user, other), user)
+    return jsonify({'conversation_id': conversation_id(user, other), 'unread': 0})
 
 @app.route("/api/ping")
 def ping():
     return jsonify({"status": "ok"})
 
+@app.route("/api/stats")
+def stats():
+    """Expose cache and snapshot counters for monitoring."""
+    snapshot = _snapshot
+    return jsonify({
+        'snapshot': {
+            'version': snapshot.version if snapshot else None,
+            'people': len(snapshot.people) if snapshot else 0,
+            'age_seconds': round(snapshot.age(), 3) if snapshot else None,
+            'ttl_seconds': PEOPLE_CACHE_TTL,
+        },
+        'geo': {
+            'valid': len(snapshot.geo) if snapshot else 0,
+            'organizations': len(snapshot.geo_by_org) if snapshot else 0,
+            'missing_coordinates': snapshot.geo_missing if snapshot else 0,
+            'rejected_coordinates': snapshot.geo_rejected if snapshot else 0,
+        },
+        'nearby_cache': nearby_cache.stats(),
+        'room_cache': room_cache.stats(),
+        'message_writer': message_writer.stats(),
+        'message_ids': recent_message_ids.stats(),
+        'mongo': dict(mongo_pool_metrics.stats(), connected=_mongo_client is not None),
+        'profile_checks': dict(profile_check_stats, bloom_filter=EMAIL_BLOOM_FILTER),
+        'sheet_queue': sheet_queue.stats(),
+        'sheets_api': dict(sheets_stats,
+                           throttled=sheets_limiter.throttled,
+                           throttle_wait_seconds=round(sheets_limiter.throttle_wait_seconds, 3),
+                           tokens=round(sheets_limiter.tokens, 2),
+                           circuit=sheets_breaker.stats()),
+    })
+
 # Socket.IO events
 @socketio.on('join_room')
 def handle_join_room(data):
@@ -341,10 +3264,20 @@ def handle_join_room(data):
     if not user1 or not user2:
         logger.warning('join_room: missing user1 or user2')
         return
-    room = ':'.join(sorted([user1, user2]))
+    room = conversation_id(user1, user2)
     logger.info(f'User joining room: {room} (user1={user1}, user2={user2})')
     join_room(room)
     emit('joined_room', {'room': room})
+    last_seen = data.get('last_seen')
+    if last_seen:
+        # Reconnect: send only what was missed, as one batch
+        position = resolve_last_seen(room, last_seen)
+        if position is None:
+            logger.warning(f'join_room: unknown last_seen {last_seen} for room {room}')
+            return
+        messages, has_more, newest = missed_messages(room, position)
+        # With has_more, the rest comes from /api/chat_history?after=<after>
+        emit('missed_messages', {'room': room, 'messages': messages, 'has_more': has_more, 'after': newest})
 
 @socketio.on('send_message')
 def handle_send_message(data):
@@ -352,21 +3285,53 @@ def handle_send_message(data):
     receiver_id = data.get('receiver_id')
     message = data.get('message')
     timestamp = data.get('timestamp')
+    client_msg_id = data.get('client_msg_id')
     logger.info(f'Received message: sender={sender_id}, receiver={receiver_id}, message={message}, timestamp={timestamp}')
     if not sender_id or not receiver_id or not message:
         logger.warning('send_message: missing sender_id, receiver_id, or message')
         return
-    room = ':'.join(sorted([sender_id, receiver_id]))
+    if not valid_user_id(sender_id) or not valid_user_id(receiver_id):
+        logger.warning(f'send_message: invalid sender_id {sender_id!r} or receiver_id {receiver_id!r}')
+        return {'error': 'invalid sender_id or receiver_id'}
+    if client_msg_id is not None and (not isinstance(client_msg_id, str)
+                                      or not 0 < len(client_msg_id) <= CLIENT_MSG_ID_MAX_LENGTH):
+        logger.warning(f'send_message: invalid client_msg_id {client_msg_id!r}')
+        return {'error': 'invalid client_msg_id'}
+    room = conversation_id(sender_id, receiver_id)
+    # ts is the server's receive time, so history order doesn't depend on client clocks.
+    # Truncated to the millisecond BSON keeps, so buffered and stored copies compare equal.
+    ts = datetime.utcnow()
+    ts = ts.replace(microsecond=ts.microsecond // 1000 * 1000)
     msg_doc = {
+        '_id': ObjectId(),  # assigned up front so the id can be emitted and retries are idempotent
         'sender_id': sender_id,
         'receiver_id': receiver_id,
         'message': message,
-        'timestamp': timestamp or datetime.utcnow().isoformat()
+        'timestamp': timestamp or ts.isoformat(),
+        'conversation_id': room,
+        'ts': ts,
     }
-    messages_collection.insert_one(msg_doc)
-    msg_doc.pop('_id', None)  # Remove ObjectId before emitting
-    logger.info(f'Message saved to MongoDB and emitting to room {room}: {msg_doc}')
-    emit('receive_message', msg_doc, room=room)
+    if client_msg_id:
+        msg_doc['client_msg_id'] = client_msg_id
+        # Checked in memory, and in the store only for sends the client marks as retries:
+        # their original may have gone through another worker, or have left the LRU.
+        # Anything else that slips through is kept out of history by the unique index.
+        original = (recent_message_ids.get(sender_id, client_msg_id)
+                    or (data.get('resend') is True and stored_resend(sender_id, client_msg_id))
+                    or recent_message_ids.claim(sender_id, client_msg_id, msg_doc))
+        if original is not None:
+            # A resend: don't store or deliver it again, just repeat the ack
+            logger.info(f'Duplicate message {client_msg_id} from {sender_id}, acknowledging original')
+            return message_ack(original, duplicate=True)
+    # Deliver first; the message writer persists it in the background
+    room_cache.append(room, msg_doc)
+    payload = client_message(msg_doc)
+    logger.info(f'Emitting message to room {room}: {payload}')
+    emit('receive_message', payload, room=room)
+    message_writer.start()
+    message_writer.submit(msg_doc)
+    # Returned to the client as the Socket.IO acknowledgement
+    return message_ack(msg_doc)
 
 # Route for static files handled automatically via static_folder argument
 
@@ -377,4 +3342,10 @@ def handle_send_message(data):
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5002))
     print(f"Starting Flask server on port {port}")
+    ensure_message_indexes()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    # Flush anything left in the write queue by a previous run
+    ensure_sheet_writer()
+    # Warm the directory snapshot so the first requests don't wait on the sheet
+    refresh_snapshot_in_background()
     socketio.run(app, host="0.0.0.0", port=port, debug=True) 
\ No newline at end of file
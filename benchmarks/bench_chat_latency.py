@@ -0,0 +1,162 @@
+"""Chat round-trip latency while slow Google Sheets fetches are in flight.
+
+    python benchmarks/bench_chat_latency.py --slow-fetches 4 --fetch-delay 2
+
+Starts the app server in a subprocess, monkey-patched the way `python app.py`
+is, with a fake Sheets API whose every call waits --fetch-delay seconds on a
+socket. A Socket.IO client then times send_message acknowledgements, first on
+an idle server and then while --slow-fetches background tasks keep re-reading
+the sheet. The two sets of timings should match: a fetch waiting on the sheet
+must not hold up the hub that serves chat.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve_slow_sheet(port, delay):
+    """An HTTP endpoint that takes delay seconds to answer, standing in for the Sheets API."""
+    class SlowHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = b'{}'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer(('127.0.0.1', port), SlowHandler).serve_forever()
+
+
+def serve_app(port, sheet_port, slow_fetches):
+    import eventlet
+    eventlet.monkey_patch()
+    import urllib.request
+    from common import load_app, synthetic_people
+
+    app = load_app()
+    rows = [[person['id'], person['name'], '', '', person['email'], str(person['latitude']),
+             str(person['longitude']), person['organization'], person['role']]
+            for person in synthetic_people(app, 1000)]
+
+    class SlowRequest:
+        def execute(self, **kwargs):
+            urllib.request.urlopen(f'http://127.0.0.1:{sheet_port}/', timeout=120).read()
+            return {'values': rows}
+
+    class SlowSheets:
+        def spreadsheets(self):
+            return self
+
+        def values(self):
+            return self
+
+        def get(self, **kwargs):
+            return SlowRequest()
+
+    app.get_google_sheets_service = lambda: SlowSheets()
+
+    def fetch_loop(until):
+        while time.monotonic() < until:
+            app.fetch_people_data()
+            app.socketio.sleep(0.1)
+
+    @app.app.route('/bench/slow-fetches', methods=['POST'])
+    def start_slow_fetches():
+        until = time.monotonic() + float(app.request.args.get('seconds', 30))
+        for _ in range(slow_fetches):
+            app.socketio.start_background_task(fetch_loop, until)
+        return app.jsonify({'started': slow_fetches})
+
+    app.socketio.run(app.app, host='127.0.0.1', port=port, log_output=False)
+
+
+def time_messages(client, count, interval):
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        ack = client.call('send_message', {'sender_id': 'bench-a', 'receiver_id': 'bench-b',
+                                           'message': f'message {i}'}, timeout=120)
+        latencies.append(time.perf_counter() - started)
+        assert ack and ack.get('id'), ack
+        time.sleep(interval)
+    return latencies
+
+
+def report(label, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    print(f"{label:28} p50 {1000 * statistics.median(ordered):8.1f} ms  p95 {1000 * p95:8.1f} ms  "
+          f"max {1000 * ordered[-1]:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slow-fetches', type=int, default=4)
+    parser.add_argument('--fetch-delay', type=float, default=2.0)
+    parser.add_argument('--messages', type=int, default=100)
+    parser.add_argument('--interval', type=float, default=0.02, help='seconds between messages')
+    parser.add_argument('--role', choices=['client', 'server', 'sheet'], default='client', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--sheet-port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == 'sheet':
+        return serve_slow_sheet(args.port, args.fetch_delay)
+    if args.role == 'server':
+        return serve_app(args.port, args.sheet_port, args.slow_fetches)
+
+    import requests
+    import socketio
+
+    port, sheet_port = free_port(), free_port()
+    script = [sys.executable, os.path.abspath(__file__), '--fetch-delay', str(args.fetch_delay),
+              '--slow-fetches', str(args.slow_fetches)]
+    children = [
+        subprocess.Popen(script + ['--role', 'sheet', '--port', str(sheet_port)]),
+        subprocess.Popen(script + ['--role', 'server', '--port', str(port), '--sheet-port', str(sheet_port)],
+                         stderr=subprocess.DEVNULL),
+    ]
+    url = f'http://127.0.0.1:{port}'
+    try:
+        for _ in range(300):
+            try:
+                requests.get(f'{url}/api/ping', timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        client = socketio.Client()
+        # Long-polling needs only requests, no websocket client library
+        client.connect(url, transports=['polling'])
+        client.emit('join_room', {'user1': 'bench-a', 'user2': 'bench-b'})
+        print(f"{args.messages} messages, {args.slow_fetches} background fetches of {args.fetch_delay}s each")
+        report('idle', time_messages(client, args.messages, args.interval))
+        seconds = args.messages * (args.interval + 0.05) + 10 * args.fetch_delay
+        requests.post(f'{url}/bench/slow-fetches', params={'seconds': seconds}).raise_for_status()
+        time.sleep(args.fetch_delay / 2)  # let the fetches get under way
+        report('during slow sheet fetches', time_messages(client, args.messages, args.interval))
+        client.disconnect()
+    finally:
+        for child in children:
+            child.terminate()
+            child.wait()
+
+
+if __name__ == '__main__':
+    main()
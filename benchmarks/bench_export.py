@@ -0,0 +1,49 @@
+"""Throughput and memory of GET /api/export for each format.
+
+    python benchmarks/bench_export.py --people 200000
+
+Prints rows/s, MB/s and how far RSS rose above its level before the export
+started. With streaming, that rise stays flat as --people grows.
+"""
+import argparse
+import gc
+import time
+
+from common import current_rss, install_snapshot, load_app, synthetic_people
+
+
+def run_export(client, fmt, people):
+    gc.collect()
+    baseline = peak = current_rss()
+    started = time.perf_counter()
+    response = client.get(f'/api/export?format={fmt}')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+        peak = max(peak, current_rss())
+    elapsed = time.perf_counter() - started
+    response.close()
+    print(f"{fmt:8} {people / elapsed:12,.0f} rows/s {size / elapsed / 2 ** 20:8.1f} MB/s "
+          f"{size / 2 ** 20:8.1f} MB  RSS +{(peak - baseline) / 2 ** 20:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--people', type=int, default=200000)
+    parser.add_argument('--formats', default='ndjson,csv,parquet')
+    args = parser.parse_args()
+
+    app = load_app()
+    install_snapshot(app, synthetic_people(app, args.people))
+    client = app.app.test_client()
+    print(f"Exporting {args.people:,} people, {app.EXPORT_CHUNK_SIZE} rows per chunk")
+    for fmt in args.formats.split(','):
+        if fmt == 'parquet' and app.pa is None:
+            print("parquet  skipped (pyarrow is not installed)")
+            continue
+        run_export(client, fmt, args.people)
+
+
+if __name__ == '__main__':
+    main()
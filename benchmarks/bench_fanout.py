@@ -0,0 +1,123 @@
+"""Multi-process Socket.IO fan-out through the message queue.
+
+    python benchmarks/bench_fanout.py --workers 4 --participants 50 --messages 500
+    python benchmarks/bench_fanout.py --queue redis://localhost:6379/0
+
+Starts --workers processes, each with its own client manager on --queue (a
+throwaway SQLite file by default) and --participants local sockets in one
+room. This process then publishes --messages receive_message events to that
+room, the way send_message does on another worker. Reports deliveries per
+second across all workers and the publish-to-delivery latency, including the
+room cache feed each worker runs on remote messages.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from common import STATE_DIR, load_app
+
+ROOM = '1:2'
+
+
+def run_worker(queue_url, participants, expected):
+    import socketio
+
+    app = load_app()
+    manager = app.make_client_manager(queue_url)
+    server = socketio.Server(client_manager=manager, async_mode='threading')
+    deliveries = []
+    lock = threading.Lock()
+
+    def send_eio_packet(eio_sid, pkt):
+        with lock:
+            deliveries.append((time.time(), pkt.data))
+    server._send_eio_packet = send_eio_packet
+    for i in range(participants):
+        sid = manager.connect(f'eio-{i}', '/')
+        manager.enter_room(sid, '/', ROOM, f'eio-{i}')
+    manager.enter_room(sid, '/', 'ready', f'eio-{i}')
+    manager.initialize()
+
+    # Publish to ourselves under another host id until the listener is running
+    pinger = app.make_client_manager(queue_url)
+    while not any('"ping"' in data for _, data in deliveries):
+        pinger.emit('ping', {}, room='ready')
+        time.sleep(0.05)
+    print('ready', flush=True)
+
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        with lock:
+            done = sum('"receive_message"' in data for _, data in deliveries) >= expected * participants
+        if done:
+            break
+        time.sleep(0.01)
+    latencies = []
+    first = last = None
+    for delivered_at, data in deliveries:
+        if '"receive_message"' not in data:
+            continue
+        payload = json.loads(data[data.index('['):])[1]
+        latencies.append(delivered_at - payload['sent_at'])
+        first = payload['sent_at'] if first is None else min(first, payload['sent_at'])
+        last = delivered_at if last is None else max(last, delivered_at)
+    cached = app.room_cache.stats()['messages']
+    print(json.dumps({'deliveries': len(latencies), 'latencies': latencies, 'first': first, 'last': last,
+                      'cached': cached}), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--participants', type=int, default=50, help='sockets in the room on each worker')
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--queue', default=f'sqlite:///{os.path.join(STATE_DIR, "pubsub.db")}')
+    parser.add_argument('--role', choices=['publisher', 'worker'], default='publisher', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == 'worker':
+        return run_worker(args.queue, args.participants, args.messages)
+
+    app = load_app()
+    workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--role', 'worker',
+                                 '--queue', args.queue, '--participants', str(args.participants),
+                                 '--messages', str(args.messages)],
+                                stdout=subprocess.PIPE, text=True)
+               for _ in range(args.workers)]
+    try:
+        for worker in workers:
+            assert worker.stdout.readline().strip() == 'ready'
+        publisher = app.make_client_manager(args.queue)
+        started = time.time()
+        for i in range(args.messages):
+            now = datetime.utcnow()
+            doc = {'_id': app.ObjectId(), 'sender_id': '1', 'receiver_id': '2', 'message': f'message {i}',
+                   'timestamp': now.isoformat(), 'conversation_id': ROOM, 'ts': now}
+            publisher.emit('receive_message', dict(app.client_message(doc), sent_at=time.time()), room=ROOM)
+        published = time.time() - started
+        results = [json.loads(worker.stdout.readline()) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    deliveries = sum(result['deliveries'] for result in results)
+    elapsed = max(result['last'] for result in results) - started
+    expected = args.workers * args.participants * args.messages
+    print(f"{args.workers} workers x {args.participants} sockets, {args.messages} messages via {args.queue.split(':')[0]}")
+    print(f"published   {args.messages / published:10,.0f} msg/s")
+    print(f"delivered   {deliveries:,} of {expected:,} in {elapsed:.2f}s, {deliveries / elapsed:10,.0f} deliveries/s")
+    print(f"latency     p50 {1000 * statistics.median(latencies):.1f} ms  "
+          f"p95 {1000 * latencies[int(0.95 * (len(latencies) - 1))]:.1f} ms  max {1000 * latencies[-1]:.1f} ms")
+    print(f"room cache  {min(result['cached'] for result in results)} messages buffered on each worker")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Insert and history-query throughput of each message store backend.
+
+    python benchmarks/bench_message_stores.py --messages 100000
+    MONGO_URI=mongodb://db:27017 python benchmarks/bench_message_stores.py --stores mongo
+
+Inserts go through insert_messages() in MESSAGE_BATCH_SIZE batches, as the
+MessageWriter does. History queries fetch the newest page of a conversation and
+then walk back through it with `before` cursors, as a scrolling client does.
+SQLite writes to a throwaway file; Mongo uses a scratch database that is dropped
+afterwards, and is skipped if MONGO_URI can't be reached.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from common import STATE_DIR, load_app
+
+BENCH_DATABASE = 'people_chat_bench'
+
+
+def synthetic_messages(app, count, conversations, seed=1):
+    """count messages spread over `conversations` pairs of people, in send order."""
+    rnd = random.Random(seed)
+    pairs = [(str(2 * n + 1), str(2 * n + 2)) for n in range(conversations)]
+    start = datetime(2024, 1, 1)
+    docs = []
+    for n in range(count):
+        sender, receiver = rnd.choice(pairs)
+        if rnd.random() < 0.5:
+            sender, receiver = receiver, sender
+        ts = start + timedelta(milliseconds=n)
+        docs.append({
+            '_id': ObjectId(), 'sender_id': sender, 'receiver_id': receiver,
+            'message': f'message {n}', 'timestamp': ts.isoformat(),
+            'conversation_id': app.conversation_id(sender, receiver), 'ts': ts,
+            'client_msg_id': f'bench-{n}',
+        })
+    return docs
+
+
+def sqlite_store(app):
+    return app.SqliteMessageStore(os.path.join(STATE_DIR, 'bench_messages.db')), lambda: None
+
+
+def mongo_store(app):
+    client = MongoClient(app.MONGO_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError as e:
+        client.close()
+        print(f"mongo    skipped ({app.MONGO_URI} is unreachable: {e.__class__.__name__})")
+        return None, None
+    client.drop_database(BENCH_DATABASE)
+
+    def cleanup():
+        client.drop_database(BENCH_DATABASE)
+        client.close()
+    return app.MongoMessageStore(lambda: client, database=BENCH_DATABASE), cleanup
+
+
+STORES = {'sqlite': sqlite_store, 'mongo': mongo_store}
+
+
+def bench_inserts(store, docs, batch_size):
+    started = time.perf_counter()
+    for offset in range(0, len(docs), batch_size):
+        inserted, failed = store.insert_messages(docs[offset:offset + batch_size])
+        assert not failed, f"{len(failed)} messages failed to insert"
+    return len(docs) / (time.perf_counter() - started)
+
+
+def bench_history(app, store, conversations, page_size):
+    """Walk every conversation back from its newest page; returns (pages/s, messages/s)."""
+    pages = messages = 0
+    started = time.perf_counter()
+    for conversation in conversations:
+        before = None
+        while True:
+            docs = store.history(conversation, page_size, before=before)
+            page = docs[-page_size:]
+            pages += 1
+            messages += len(page)
+            if len(docs) <= page_size:
+                break
+            before = app.message_position(page[0])
+    elapsed = time.perf_counter() - started
+    return pages / elapsed, messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--conversations', type=int, default=50)
+    parser.add_argument('--stores', default='sqlite,mongo')
+    args = parser.parse_args()
+
+    app = load_app()
+    docs = synthetic_messages(app, args.messages, args.conversations)
+    conversations = sorted({doc['conversation_id'] for doc in docs})
+    print(f"{args.messages:,} messages over {len(conversations)} conversations, "
+          f"{app.MESSAGE_BATCH_SIZE} per insert, {app.CHAT_HISTORY_PAGE_SIZE} per history page")
+    for name in args.stores.split(','):
+        store, cleanup = STORES[name](app)
+        if store is None:
+            continue
+        try:
+            store.ensure_schema()
+            inserts = bench_inserts(store, docs, app.MESSAGE_BATCH_SIZE)
+            pages, messages = bench_history(app, store, conversations, app.CHAT_HISTORY_PAGE_SIZE)
+        finally:
+            cleanup()
+        print(f"{name:8} insert {inserts:10,.0f} msgs/s   history {pages:8,.0f} pages/s {messages:10,.0f} msgs/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Shared setup for the benchmark scripts: import app.py against throwaway state, quietly."""
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_DIR = tempfile.mkdtemp(prefix='people-bench-')
+
+os.environ.setdefault('STATE_DB_PATH', os.path.join(STATE_DIR, 'app_state.db'))
+os.environ.setdefault('MESSAGE_STORE', 'sqlite')
+os.environ.setdefault('MESSAGE_DB_PATH', os.path.join(STATE_DIR, 'messages.db'))
+sys.path.insert(0, ROOT)
+
+
+def load_app():
+    import app
+    # app.py logs at DEBUG, which would dominate every timing
+    logging.disable(logging.INFO)
+    return app
+
+
+def synthetic_people(app, count, seed=1):
+    """count people spread over a handful of organizations, parsed from sheet-style rows."""
+    rnd = random.Random(seed)
+    organizations = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli']
+    return [app.parse_person_row([
+        str(person_id), f'Person {person_id}', f'https://example.com/photos/{person_id}.jpg',
+        f'+1555{person_id:07d}', f'person{person_id}@example.com',
+        str(rnd.uniform(-60, 70)), str(rnd.uniform(-180, 180)), rnd.choice(organizations), 'Engineer',
+    ]) for person_id in range(1, count + 1)]
+
+
+def install_snapshot(app, people):
+    """Serve people from memory as the directory snapshot, without ever reading the sheet."""
+    app.PEOPLE_CACHE_TTL = float('inf')
+    app._snapshot = app.PeopleSnapshot(people, 1)
+    return app._snapshot
+
+
+def current_rss():
+    """Resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # No procfs (macOS): fall back to the high-water mark, in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -3,6 +3,7 @@ import { useUser } from "@clerk/clerk-react";
 import { useState } from "react";
 import io from "socket.io-client";
 import { useNavigate } from "react-router-dom";
+import { newClientMsgId } from "../utils/clientMsgId";
 
 const API_BASE_URL = 'http://localhost:5002';
 
@@ -41,9 +42,10 @@ const ChatModal = ({ open, onClose, person }) => {
     setLoading(true);
     // Fetch chat history
     const fetchHistory = async () => {
-      const res = await fetch(`${API_BASE_URL}/api/chat_history?user1=${myProfile.id}&user2=${person.id}`);
+      // Only the latest page; the full history lives on the chat page
+      const res = await fetch(`${API_BASE_URL}/api/chat_history?user1=${myProfile.id}&user2=${person.id}&limit=50`);
       const data = await res.json();
-      setMessages(data || []);
+      setMessages(data.messages || []);
       setLoading(false);
     };
     fetchHistory();
@@ -70,6 +72,8 @@ const ChatModal = ({ open, onClose, person }) => {
       receiver_id: person.id,
       message: input.trim(),
       timestamp: new Date().toISOString(),
+      // Lets the server recognise a resend of the same message
+      client_msg_id: newClientMsgId(),
     };
     socketRef.current.emit('send_message', msg);
     setInput("");
@@ -8,8 +8,11 @@ try {
 import React, { useEffect, useState, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useUser } from '@clerk/clerk-react';
+import { newClientMsgId } from '../utils/clientMsgId';
 
 const API_BASE_URL = 'http://localhost:5002';
+const HISTORY_PAGE_SIZE = 50;
+const MISSED_PAGE_SIZE = 500; // the server's largest page
 
 const ChatPage = () => {
   console.log('ChatPage mounted');
@@ -23,11 +26,48 @@ const ChatPage = () => {
   const [loading, setLoading] = useState(true);
   const [profileCheck, setProfileCheck] = useState('checking'); // 'checking', 'notfound', 'found'
   const [error, setError] = useState('');
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const socketRef = useRef(null);
   const messagesEndRef = useRef(null);
+  const historyRef = useRef(null);
+  const prependedFromRef = useRef(null); // scrollHeight before older messages were prepended
+  const messagesRef = useRef([]);
+  messagesRef.current = messages;
 
-  // Scroll to bottom when messages change
+  // Append messages that aren't shown yet (a reconnect catch-up can overlap what we have)
+  const appendMessages = (incoming) => {
+    setMessages(prev => {
+      const known = new Set(prev.map(m => m.id).filter(Boolean));
+      const fresh = incoming.filter(m => !m.id || !known.has(m.id));
+      if (!fresh.length) return prev;
+      // Catch-up pages can arrive after newer live messages, so keep server order
+      return [...prev, ...fresh].sort((a, b) => ((a.ts || '') < (b.ts || '') ? -1 : (a.ts || '') > (b.ts || '') ? 1 : 0));
+    });
+  };
+
+  // Fetch the rest of a catch-up that didn't fit in one missed_messages event
+  const fetchNewerMessages = async (cursor) => {
+    try {
+      while (cursor) {
+        const res = await fetch(`${API_BASE_URL}/api/chat_history?user1=${myProfile.id}&user2=${userId}&limit=${MISSED_PAGE_SIZE}&after=${encodeURIComponent(cursor)}`);
+        const data = await res.json();
+        appendMessages(data.messages || []);
+        cursor = data.has_more ? data.after : null;
+      }
+    } catch (err) {
+      console.error('Failed to load missed messages:', err);
+    }
+  };
+
+  // Scroll to bottom when messages change, or keep the view still after loading older ones
   useEffect(() => {
+    if (prependedFromRef.current !== null && historyRef.current) {
+      historyRef.current.scrollTop = historyRef.current.scrollHeight - prependedFromRef.current;
+      prependedFromRef.current = null;
+      return;
+    }
     if (messagesEndRef.current) {
       messagesEndRef.current.scrollIntoView({ behavior: 'smooth' });
     }
@@ -90,12 +130,20 @@ const ChatPage = () => {
     // Fetch chat history
     const fetchHistory = async () => {
       try {
-        const res = await fetch(`${API_BASE_URL}/api/chat_history?user1=${myProfile.id}&user2=${userId}`);
+        const res = await fetch(`${API_BASE_URL}/api/chat_history?user1=${myProfile.id}&user2=${userId}&limit=${HISTORY_PAGE_SIZE}`);
         const data = await res.json();
         if (isMounted) {
-          setMessages(Array.isArray(data) ? data : []);
+          setMessages(Array.isArray(data.messages) ? data.messages : []);
+          setOlderCursor(data.before || null);
+          setHasOlder(!!data.has_more);
           setLoading(false);
         }
+        // Opening the chat clears its unread counter
+        fetch(`${API_BASE_URL}/api/conversations/read`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ user: myProfile.id, other: userId }),
+        });
       } catch (err) {
         setError('Failed to load chat history.');
         setLoading(false);
@@ -107,18 +155,25 @@ const ChatPage = () => {
     console.log('Connecting to Socket.IO using window._io...');
     socketRef.current = window._io(API_BASE_URL);
     console.log('Socket.IO instance:', socketRef.current);
+    // (Re)join on every connect; after a reconnect the server replays only what we missed
     socketRef.current.on('connect', () => {
       console.log('Socket.IO connected!', socketRef.current.id);
+      const last = messagesRef.current[messagesRef.current.length - 1];
+      console.log('Joining room:', { user1: myProfile.id, user2: userId, room: roomName });
+      socketRef.current.emit('join_room', { user1: myProfile.id, user2: userId, last_seen: last?.id });
+    });
+    socketRef.current.on('missed_messages', (data) => {
+      console.log('Missed messages:', data.messages.length, 'more:', data.has_more);
+      appendMessages(data.messages);
+      if (data.has_more && data.after) fetchNewerMessages(data.after);
     });
-    console.log('Joining room:', { user1: myProfile.id, user2: userId, room: roomName });
-    socketRef.current.emit('join_room', { user1: myProfile.id, user2: userId });
     socketRef.current.on('joined_room', (data) => {
       console.log('Joined room:', data);
     });
     socketRef.current.on('receive_message', (msg) => {
       console.log('Received message:', msg);
       if ((msg.sender_id === myProfile.id && msg.receiver_id === userId) || (msg.sender_id === userId && msg.receiver_id === myProfile.id)) {
-        setMessages(prev => [...prev, msg]);
+        appendMessages([msg]);
       }
     });
     socketRef.current.on('connect_error', (err) => {
@@ -132,6 +187,23 @@ const ChatPage = () => {
     };
   }, [myProfile, otherProfile, userId]);
 
+  // Load the previous page when the history is scrolled to the top
+  const handleHistoryScroll = async (e) => {
+    if (e.currentTarget.scrollTop > 0 || !hasOlder || loadingOlder || !olderCursor) return;
+    setLoadingOlder(true);
+    try {
+      const res = await fetch(`${API_BASE_URL}/api/chat_history?user1=${myProfile.id}&user2=${userId}&limit=${HISTORY_PAGE_SIZE}&before=${encodeURIComponent(olderCursor)}`);
+      const data = await res.json();
+      if (historyRef.current) prependedFromRef.current = historyRef.current.scrollHeight;
+      setMessages(prev => [...(data.messages || []), ...prev]);
+      setOlderCursor(data.before || null);
+      setHasOlder(!!data.has_more);
+    } catch (err) {
+      console.error('Failed to load older messages:', err);
+    }
+    setLoadingOlder(false);
+  };
+
   // Send message
   const handleSend = async () => {
     if (!input.trim() || !myProfile || !userId) return;
@@ -140,9 +212,13 @@ const ChatPage = () => {
       receiver_id: userId,
       message: input.trim(),
       timestamp: new Date().toISOString(),
+      // Lets the server recognise a resend of the same message
+      client_msg_id: newClientMsgId(),
     };
     console.log('Sending message:', msg);
-    socketRef.current.emit('send_message', msg);
+    socketRef.current.emit('send_message', msg, (ack) => {
+      console.log('Message acknowledged:', ack);
+    });
     setInput('');
   };
 
@@ -181,7 +257,8 @@ const ChatPage = () => {
     <div className="chat-page">
       <div className="chat-box">
         <h2 style={{ color: '#00c6ff' }}>Chat with {otherProfile ? otherProfile.name : userId}</h2>
-        <div className="chat-history" style={{ maxHeight: 300, minHeight: 200, overflowY: 'auto', marginBottom: 16, background: '#222', padding: 8, borderRadius: 8 }}>
+        <div className="chat-history" ref={historyRef} onScroll={handleHistoryScroll} style={{ maxHeight: 300, minHeight: 200, overflowY: 'auto', marginBottom: 16, background: '#222', padding: 8, borderRadius: 8 }}>
+          {loadingOlder && <div style={{ textAlign: 'center', color: '#aaa', fontSize: 12 }}>Loading older messages...</div>}
           {error ? <div style={{ color: 'red' }}>{error}</div> :
             loading ? <div>Loading...</div> :
             messages.length === 0 ? <div>No messages yet.</div> :
@@ -0,0 +1,12 @@
+// Id the server uses to recognise a resend of the same chat message.
+// crypto.randomUUID() only exists in secure contexts (https or localhost);
+// getRandomValues() works everywhere, with Math.random() as a last resort.
+export const newClientMsgId = () => {
+  if (typeof crypto !== 'undefined') {
+    if (typeof crypto.randomUUID === 'function') return crypto.randomUUID();
+    if (typeof crypto.getRandomValues === 'function') {
+      return Array.from(crypto.getRandomValues(new Uint8Array(16)), b => b.toString(16).padStart(2, '0')).join('');
+    }
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+};
@@ -0,0 +1,76 @@
+"""app.py is imported once per session, against throwaway state files and a fake Sheets API."""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_DIR = tempfile.mkdtemp(prefix='people-tests-')
+
+# Read by app.py at import time
+os.environ.setdefault('STATE_DB_PATH', os.path.join(STATE_DIR, 'app_state.db'))
+os.environ.setdefault('MESSAGE_STORE', 'sqlite')
+os.environ.setdefault('MESSAGE_DB_PATH', os.path.join(STATE_DIR, 'messages.db'))
+os.environ.setdefault('SHEETS_REQUESTS_PER_MINUTE', '600000')
+os.environ.setdefault('SHEETS_BURST', '1000')
+
+sys.path.insert(0, ROOT)
+
+import app as app_module  # noqa: E402
+from tests.fakes import FakeSheetsService, person_row  # noqa: E402
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    """The app module with fresh local state and no background tasks."""
+    monkeypatch.setattr(app_module, 'id_allocator', app_module.IdAllocator(str(tmp_path / 'state.db')))
+    monkeypatch.setattr(app_module, 'sheet_queue', app_module.SheetWriteQueue(str(tmp_path / 'state.db')))
+    monkeypatch.setattr(app_module, 'sheets_breaker', app_module.CircuitBreaker(
+        app_module.SHEETS_BREAKER_THRESHOLD, app_module.SHEETS_BREAKER_RESET))
+    monkeypatch.setattr(app_module, '_snapshot', None)
+    # Tests drain the sheet queue themselves with flush_sheet_queue()
+    monkeypatch.setattr(app_module, 'ensure_sheet_writer', lambda: None)
+    return app_module
+
+
+@pytest.fixture
+def sheet(app, monkeypatch):
+    """A fake sheet holding five people, served to the app in place of the Sheets API."""
+    service = FakeSheetsService([person_row(person_id) for person_id in range(1, 6)])
+    monkeypatch.setattr(app, 'get_google_sheets_service', lambda: service)
+    return service
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+@pytest.fixture
+def chat(app, monkeypatch, tmp_path):
+    """The app with an empty SQLite message store, room cache and resend memory."""
+    monkeypatch.setattr(app, 'message_store', app.SqliteMessageStore(str(tmp_path / 'messages.db')))
+    monkeypatch.setattr(app, 'room_cache', app.RoomMessageCache(app.ROOM_BUFFER_SIZE, app.ROOM_CACHE_MAX_BYTES))
+    monkeypatch.setattr(app, 'recent_message_ids', app.RecentMessageIds(app.RECENT_MESSAGE_IDS))
+    return app
+
+
+@pytest.fixture
+def store_messages(chat):
+    """Write count messages from sender to receiver, one millisecond apart, straight to the store."""
+    def store(sender, receiver, count, start=datetime(2024, 1, 1)):
+        docs = [{
+            '_id': ObjectId(),
+            'sender_id': sender,
+            'receiver_id': receiver,
+            'message': f'message {i}',
+            'timestamp': (start + timedelta(milliseconds=i)).isoformat(),
+            'conversation_id': chat.conversation_id(sender, receiver),
+            'ts': start + timedelta(milliseconds=i),
+        } for i in range(count)]
+        chat.message_store.insert_messages(docs)
+        return docs
+    return store
@@ -0,0 +1,77 @@
+"""In-memory stand-in for the parts of the Google Sheets API that app.py calls."""
+import re
+import threading
+
+
+class FakeRequest:
+    def __init__(self, execute):
+        self._execute = execute
+
+    def execute(self, **kwargs):
+        return self._execute()
+
+
+class FakeValues:
+    """spreadsheets().values() over a list of rows that starts at sheet row 2."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get(self, spreadsheetId, range, **kwargs):
+        self.calls.append(('get', range))
+
+        def execute():
+            with self._lock:
+                if range.startswith('Sheet1!A2:A'):
+                    return {'values': [row[:1] for row in self.rows]}
+                return {'values': [list(row) for row in self.rows]}
+        return FakeRequest(execute)
+
+    def append(self, spreadsheetId, range, body, **kwargs):
+        self.calls.append(('append', len(body['values'])))
+
+        def execute():
+            with self._lock:
+                start = len(self.rows) + 2
+                self.rows.extend(list(row) for row in body['values'])
+            end = start + len(body['values']) - 1
+            return {'updates': {'updatedRange': f'Sheet1!A{start}:I{end}', 'updatedRows': len(body['values'])}}
+        return FakeRequest(execute)
+
+    def batchUpdate(self, spreadsheetId, body, **kwargs):
+        self.calls.append(('batchUpdate', len(body['data'])))
+
+        def execute():
+            with self._lock:
+                for data in body['data']:
+                    sheet_row = int(re.match(r'Sheet1!A(\d+):', data['range']).group(1))
+                    self.rows[sheet_row - 2] = list(data['values'][0])
+            return {}
+        return FakeRequest(execute)
+
+
+class FakeSheetsService:
+    def __init__(self, rows=None):
+        self.values_api = FakeValues(rows if rows is not None else [])
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self.values_api
+
+    @property
+    def rows(self):
+        return self.values_api.rows
+
+    @property
+    def calls(self):
+        return self.values_api.calls
+
+
+def person_row(person_id, email=None, organization='Acme', latitude='1.5', longitude='2.5'):
+    """A sheet row in the A:I column layout."""
+    return [str(person_id), f'Person {person_id}', '', '', email or f'person{person_id}@example.com',
+            latitude, longitude, organization, 'Engineer']
@@ -0,0 +1,104 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+
+def test_reconnect_catch_up_continues_past_one_page(chat, client, store_messages):
+    docs = store_messages('1', '2', chat.CHAT_HISTORY_MAX_PAGE + 100)
+    socket = chat.socketio.test_client(chat.app)
+
+    socket.emit('join_room', {'user1': '1', 'user2': '2', 'last_seen': str(docs[0]['_id'])})
+
+    (event,) = [e for e in socket.get_received() if e['name'] == 'missed_messages']
+    missed = event['args'][0]
+    assert len(missed['messages']) == chat.CHAT_HISTORY_MAX_PAGE
+    assert missed['has_more'] is True
+
+    rest = client.get(f"/api/chat_history?user1=1&user2=2&limit={chat.CHAT_HISTORY_MAX_PAGE}"
+                      f"&after={missed['after']}").get_json()
+    assert rest['has_more'] is False
+    ids = [m['id'] for m in missed['messages'] + rest['messages']]
+    assert ids == [str(doc['_id']) for doc in docs[1:]]
+
+
+def send(socket, message, client_msg_id, sender='1', receiver='2', **extra):
+    return socket.emit('send_message', dict(extra, sender_id=sender, receiver_id=receiver,
+                                            message=message, client_msg_id=client_msg_id), callback=True)
+
+
+def test_resend_forgotten_by_this_worker_is_found_in_the_store(chat, client, monkeypatch):
+    monkeypatch.setattr(chat, 'recent_message_ids', chat.RecentMessageIds(1))
+    socket = chat.socketio.test_client(chat.app)
+    socket.emit('join_room', {'user1': '1', 'user2': '2'})
+    first = send(socket, 'hello', 'c1')
+    send(socket, 'other', 'c2')  # pushes c1 out of the one-entry LRU
+    chat.message_writer.flush()
+    socket.get_received()
+
+    resend = send(socket, 'hello', 'c1', resend=True)
+
+    assert resend == dict(first, duplicate=True)
+    assert not [e for e in socket.get_received() if e['name'] == 'receive_message']
+    history = client.get('/api/chat_history?user1=1&user2=2').get_json()
+    assert [m['message'] for m in history] == ['hello', 'other']
+
+
+def test_first_sends_do_not_wait_on_the_store(chat, monkeypatch):
+    def lookup(sender_id, client_msg_id):
+        raise AssertionError('looked up before delivery')
+    monkeypatch.setattr(chat.message_store, 'find_by_client_id', lookup)
+    socket = chat.socketio.test_client(chat.app)
+    socket.emit('join_room', {'user1': '1', 'user2': '2'})
+
+    ack = send(socket, 'hello', 'c1')
+
+    assert ack['duplicate'] is False
+    assert [e['name'] for e in socket.get_received()].count('receive_message') == 1
+
+
+def test_resend_stored_by_another_worker_is_dropped_from_the_cache(chat):
+    original = {'_id': ObjectId(), 'sender_id': '1', 'receiver_id': '2', 'message': 'hello',
+                'timestamp': '2024-01-01T00:00:00', 'conversation_id': '1:2',
+                'ts': datetime(2024, 1, 1), 'client_msg_id': 'c9'}
+    chat.message_store.insert_messages([original])
+    # The resend reached this worker before the other worker's copy was stored
+    resend = dict(original, _id=ObjectId(), ts=datetime(2024, 1, 1, 0, 0, 1))
+    chat.room_cache.append('1:2', resend)
+
+    chat.message_writer._write([resend])
+
+    assert chat.room_cache.find('1:2', resend['_id']) is None
+    assert chat.recent_message_ids.get('1', 'c9')['_id'] == original['_id']
+
+
+def test_sigterm_writes_the_in_flight_batch_and_the_queue(chat, monkeypatch, client):
+    writer = chat.MessageWriter(batch_size=2, flush_interval=0.01, max_queued=100)
+    monkeypatch.setattr(chat, 'message_writer', writer)
+    socket = chat.socketio.test_client(chat.app)
+    for i in range(5):
+        send(socket, f'message {i}', f'c{i}')
+    # As if the background writer had just taken a batch off the queue
+    writer._next_batch()
+    assert len(writer._in_flight) == 2
+
+    with pytest.raises(SystemExit):
+        chat.handle_sigterm(chat.signal.SIGTERM, None)
+
+    history = client.get('/api/chat_history?user1=1&user2=2').get_json()
+    assert [m['message'] for m in history] == [f'message {i}' for i in range(5)]
+    # Handlers still running during shutdown write straight through
+    send(socket, 'late', 'c5')
+    assert len(client.get('/api/chat_history?user1=1&user2=2').get_json()) == 6
+
+
+@pytest.mark.parametrize('sender, receiver', [('1', 'a.b'), ('$where', '2'), (1, '2')])
+def test_sends_with_unusable_user_ids_are_refused(chat, client, sender, receiver):
+    socket = chat.socketio.test_client(chat.app)
+    queued = chat.message_writer.stats()['queued']
+
+    ack = send(socket, 'hello', 'c1', sender=sender, receiver=receiver)
+
+    assert ack == {'error': 'invalid sender_id or receiver_id'}
+    assert not [e for e in socket.get_received() if e['name'] == 'receive_message']
+    assert chat.message_writer.stats()['queued'] == queued
@@ -0,0 +1,36 @@
+import pytest
+
+
+def test_single_email_lookup(app, sheet, client):
+    assert client.get('/api/check_profile_exists?email=Person1@Example.com').get_json() == {'exists': True}
+    assert client.get('/api/check_profile_exists?email=nobody@example.com').get_json() == {'exists': False}
+    assert client.get('/api/check_profile_exists').status_code == 400
+
+
+def test_batch_lookup(app, sheet, client):
+    expected = {'results': {'person1@example.com': True, 'nobody@example.com': False}}
+    assert client.get('/api/check_profile_exists?emails=person1@example.com,nobody@example.com').get_json() == expected
+    response = client.post('/api/check_profile_exists', json={'emails': ['person1@example.com', 'nobody@example.com']})
+    assert response.get_json() == expected
+
+
+@pytest.mark.parametrize('body', [{'emails': 'a@b.c'}, ['a@b.c'], {'emails': [1]}, {'emails': {'a@b.c': True}}])
+def test_malformed_batch_bodies_are_rejected(app, sheet, client, body):
+    assert client.post('/api/check_profile_exists', json=body).status_code == 400
+
+
+def test_bloom_filter_answers_misses_without_the_index(app, sheet, client, monkeypatch):
+    monkeypatch.setattr(app, 'EMAIL_BLOOM_FILTER', True)
+    monkeypatch.setattr(app, 'profile_check_stats', {'lookups': 0, 'bloom_negatives': 0})
+    emails = [f'person{i}@example.com' for i in range(1, 6)] + [f'stranger{i}@example.com' for i in range(50)]
+
+    results = client.post('/api/check_profile_exists', json={'emails': emails}).get_json()['results']
+
+    assert [email for email, exists in results.items() if exists] == emails[:5]
+    # Every member passes the filter; nearly every stranger is turned away by it
+    assert app.profile_check_stats['lookups'] == 55
+    assert app.profile_check_stats['bloom_negatives'] >= 45
+    assert client.post('/api/check_profile_exists', json={'emails': ['new@example.com']}).get_json() == \
+        {'results': {'new@example.com': False}}
+    client.post('/api/submit', json={'name': 'New', 'email': 'new@example.com', 'organization': 'Acme'})
+    assert client.get('/api/check_profile_exists?email=new@example.com').get_json() == {'exists': True}
@@ -0,0 +1,18 @@
+import io
+
+import pytest
+
+
+def test_parquet_export_coerces_non_text_cells(app, sheet, client):
+    pq = pytest.importorskip('pyarrow.parquet')
+    snapshot = app.get_people_snapshot()
+    snapshot.people[0]['role'] = 7
+    snapshot.people[1]['phone'] = 5550100
+
+    response = client.get('/api/export?format=parquet')
+
+    table = pq.read_table(io.BytesIO(response.get_data()))
+    assert table.num_rows == 5
+    assert table.column('role').to_pylist()[:2] == ['7', 'Engineer']
+    assert table.column('phone').to_pylist()[1] == '5550100'
+    assert table.column('latitude').to_pylist()[0] == 1.5
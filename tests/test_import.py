@@ -0,0 +1,57 @@
+import io
+import json
+
+import pytest
+
+
+@pytest.fixture
+def run_imports(app, monkeypatch):
+    """Run import jobs inline, so the POST returns once the job has finished."""
+    monkeypatch.setattr(app.socketio, 'start_background_task', lambda task, *args: task(*args))
+    return app
+
+
+def import_file(client, name, content):
+    response = client.post('/api/import', data={'file': (io.BytesIO(content.encode()), name)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    return client.get(f"/api/import/{response.get_json()['job_id']}").get_json()
+
+
+def test_csv_import_skips_duplicates_and_invalid_rows(run_imports, sheet, client):
+    job = import_file(client, 'people.csv', '\n'.join([
+        'name,email,organization,latitude,longitude',
+        'New One,new1@example.com,Acme,10,20',
+        'Again,NEW1@example.com,Acme,,',
+        'Known,person3@example.com,Acme,,',
+        'No Org,new2@example.com,,,',
+        'Far,new3@example.com,Acme,91,0',
+        'New Two,new4@example.com,Globex,,',
+    ]))
+
+    assert job['status'] == 'done'
+    assert (job['processed'], job['accepted'], job['duplicates'], job['invalid']) == (6, 2, 2, 2)
+    assert [error['line'] for error in job['errors']] == [5, 6]
+    assert len(run_imports.sheet_queue.pending_writes()) == 2
+    assert run_imports.flush_sheet_queue() == 0
+    assert [row[4] for row in sheet.rows[5:]] == ['new1@example.com', 'new4@example.com']
+
+
+def test_jsonl_import_rejects_non_text_fields(run_imports, sheet, client):
+    lines = [
+        json.dumps({'name': 'Fine', 'email': 'fine@example.com', 'organization': 'Acme'}),
+        json.dumps({'name': 'Numeric', 'email': 'numeric@example.com', 'organization': 'Acme', 'role': 7}),
+        'not json',
+        json.dumps({'name': 'Also fine', 'email': 'also@example.com', 'organization': 'Acme', 'phone': '+1555'}),
+    ]
+    job = import_file(client, 'people.jsonl', '\n'.join(lines))
+
+    assert job['status'] == 'done'
+    assert (job['accepted'], job['invalid']) == (2, 2)
+    assert job['errors'][0] == {'line': 2, 'error': 'role must be a string'}
+    assert len(run_imports.sheet_queue.pending_writes()) == job['accepted']
+
+    # Everything accepted is already in the email index, so a rerun queues nothing new
+    rerun = import_file(client, 'people.jsonl', '\n'.join(lines))
+    assert (rerun['accepted'], rerun['duplicates']) == (0, 2)
+    assert len(run_imports.sheet_queue.pending_writes()) == 2
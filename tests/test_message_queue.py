@@ -0,0 +1,71 @@
+"""Cross-worker delivery over the SQLite message queue, with a second process as the other worker."""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import socketio
+from bson import ObjectId
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PUBLISHER = """
+import sys
+from datetime import datetime
+from bson import ObjectId
+import app
+
+manager = app.SqlitePubSubManager(sys.argv[1], channel='test', write_only=True)
+ts = datetime(2024, 1, 1)
+for i in range(int(sys.argv[2])):
+    doc = {'_id': ObjectId(), 'sender_id': '1', 'receiver_id': '2', 'message': f'message {i}',
+           'timestamp': ts.isoformat(), 'conversation_id': '1:2', 'ts': ts}
+    manager.emit('receive_message', app.client_message(doc), room='1:2')
+    print(doc['_id'], flush=True)
+"""
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_messages_published_by_another_process_reach_local_rooms_and_cache(chat, tmp_path):
+    url = f'sqlite:///{tmp_path}/pubsub.db'
+    manager = chat.SqlitePubSubManager(url, channel='test')
+    server = socketio.Server(client_manager=manager, async_mode='threading')
+    delivered = []
+    lock = threading.Lock()
+
+    def send_eio_packet(eio_sid, pkt):
+        with lock:
+            delivered.append((eio_sid, pkt.data))
+    server._send_eio_packet = send_eio_packet
+    # One local participant in room 1:2, and one in a room used to see the listener is running
+    sid = manager.connect('eio-1', '/')
+    manager.enter_room(sid, '/', '1:2', 'eio-1')
+    manager.enter_room(sid, '/', 'ready', 'eio-1')
+    manager.initialize()
+
+    # Another host id, so the listener treats these as remote
+    pinger = chat.SqlitePubSubManager(url, channel='test', write_only=True)
+    def listening():
+        pinger.emit('ping', {}, room='ready')
+        time.sleep(0.05)
+        return any('ping' in data for _, data in delivered)
+    wait_for(listening)
+
+    result = subprocess.run([sys.executable, '-c', PUBLISHER, url, '5'], cwd=ROOT, env=os.environ.copy(),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    ids = result.stdout.split()
+    assert len(ids) == 5
+
+    wait_for(lambda: sum('receive_message' in data for _, data in delivered) == 5)
+    assert {eio_sid for eio_sid, data in delivered if 'receive_message' in data} == {'eio-1'}
+    for message_id in ids:
+        cached = chat.room_cache.find('1:2', ObjectId(message_id))
+        assert cached is not None and cached['conversation_id'] == '1:2'
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+
+def mongo_store(app, tmp_path):
+    mongomock = pytest.importorskip('mongomock')
+    client = mongomock.MongoClient()
+    store = app.MongoMessageStore(lambda: client)
+    collection = store.conversations_collection
+
+    def bulk_write(requests, ordered=True):
+        # mongomock's bulk API predates the sort option pymongo now passes along
+        for request in requests:
+            collection.update_one(request._filter, request._doc, upsert=request._upsert)
+    collection.bulk_write = bulk_write  # mongomock hands out the same collection object every time
+    return store
+
+
+STORES = {
+    'sqlite': lambda app, tmp_path: app.SqliteMessageStore(str(tmp_path / 'messages.db')),
+    'mongo': mongo_store,
+}
+
+
+@pytest.fixture(params=sorted(STORES))
+def store(request, app, tmp_path, monkeypatch):
+    store = STORES[request.param](app, tmp_path)
+    monkeypatch.setattr(app, 'message_store', store)
+    return store
+
+
+def message(app, sender, receiver, text, ts):
+    return {'_id': ObjectId(), 'sender_id': sender, 'receiver_id': receiver, 'message': text,
+            'timestamp': ts.isoformat(), 'conversation_id': app.conversation_id(sender, receiver), 'ts': ts}
+
+
+def test_an_older_batch_does_not_roll_the_inbox_back(app, store):
+    now = datetime(2024, 1, 1, 12)
+    app.update_conversations([message(app, '1', '2', '$newer', now)])
+    # e.g. a retried batch, or another worker's slower write
+    app.update_conversations([message(app, '2', '1', 'older', now - timedelta(minutes=5))])
+
+    (summary,) = store.conversations('1', 10)
+    assert summary['last_message']['message'] == '$newer'
+    assert summary['unread'] == 1
+    (summary,) = store.conversations('2', 10)
+    assert summary['unread'] == 1
+
+
+def test_an_incomplete_store_fails_when_created(app):
+    class HistoryOnly(app.MessageStore):
+        def history(self, conversation, limit, before=None, after=None):
+            return []
+
+    with pytest.raises(TypeError, match='abstract'):
+        HistoryOnly()
+
+
+def test_history_pages_walk_the_whole_conversation(app, store):
+    start = datetime(2024, 1, 1)
+    docs = [message(app, '1', '2', f'message {i}', start + timedelta(milliseconds=i // 3)) for i in range(25)]
+    store.insert_messages(docs)
+    expected = sorted(docs, key=app.message_position)
+
+    seen, before = [], None
+    while True:
+        page = store.history('1:2', 10, before=before)
+        older, page = page[:-10], page[-10:]
+        seen[:0] = page
+        if not older:
+            break
+        before = app.message_position(page[0])
+    assert [doc['_id'] for doc in seen] == [doc['_id'] for doc in expected]
+    assert store.find_message('1:2', docs[7]['_id'])['message'] == 'message 7'
+
+
+def test_ensure_indexes_command_fails_when_the_store_does(app, store, monkeypatch):
+    def unreachable():
+        raise ConnectionError('store is unreachable')
+    runner = app.app.test_cli_runner()
+    assert runner.invoke(args=['ensure-indexes']).exit_code == 0
+
+    monkeypatch.setattr(store, 'ensure_schema', unreachable)
+    result = runner.invoke(args=['ensure-indexes'])
+    assert result.exit_code == 1
+    assert 'store is unreachable' in result.output
+    app.ensure_message_indexes()  # server startup still carries on
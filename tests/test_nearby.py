@@ -0,0 +1,113 @@
+"""Every nearby path (plain, geohash-cached, streamed, batched) against a brute-force haversine scan."""
+import json
+import random
+
+import pytest
+
+from tests.fakes import FakeSheetsService, person_row
+
+CENTERS = [(0.0, 0.0), (51.5, -0.1), (-33.9, 151.2), (10.0, 179.8), (10.0, -179.8), (88.4, 30.0)]
+ORGANIZATIONS = ['Acme', 'ACME', 'Globex', 'Initech', '']
+QUERIES = [(0.0, 0.0, 300), (51.4, 0.2, 60), (-34.5, 150.0, 400), (10.0, 180.0, 150), (10.2, -179.9, 40),
+           (89.9, -150.0, 200), (30.0, 30.0, 50)]
+
+
+def random_row(rnd, person_id):
+    lat, lon = rnd.choice(CENTERS)
+    # Bounded offsets keep everyone off the poles, where many distances would tie
+    lat += rnd.uniform(-1.5, 1.5)
+    lon = (lon + rnd.uniform(-1.5, 1.5) + 180) % 360 - 180
+    return person_row(person_id, organization=rnd.choice(ORGANIZATIONS), latitude=f'{lat:.5f}', longitude=f'{lon:.5f}')
+
+
+@pytest.fixture
+def directory(app, monkeypatch):
+    rnd = random.Random(7)
+    rows = [random_row(rnd, person_id) for person_id in range(1, 401)]
+    # Exactly on the equator and the prime meridian, without coordinates, and out of range
+    rows += [person_row(401, latitude='0.0', longitude='0.0'), person_row(402, latitude='0', longitude='0.5'),
+             person_row(403, latitude='', longitude=''), person_row(404, latitude='95', longitude='0')]
+    service = FakeSheetsService(rows)
+    monkeypatch.setattr(app, 'get_google_sheets_service', lambda: service)
+    monkeypatch.setattr(app, 'GEO_GRID_CELL_DEG', 1.0)
+    monkeypatch.setattr(app, 'nearby_cache', app.NearbyCellCache(app.NEARBY_CACHE_SIZE))
+    app.get_people_snapshot()
+    return rnd
+
+
+def brute_force(app, lat, lon, radius_km, org=''):
+    """{id: distance_km} of everyone with valid coordinates within radius_km, by a plain scan."""
+    matches = {}
+    for person in app._snapshot.people:
+        if org and (person['organization'] or '').lower() != org.lower():
+            continue
+        if not app.valid_coordinates(person['latitude'], person['longitude']):
+            continue
+        dist = app.haversine_distance(lat, lon, person['latitude'], person['longitude'])
+        if dist <= radius_km:
+            matches[person['id']] = dist
+    return matches
+
+
+def assert_matches(found, expected):
+    """found is a distance-sorted list of people; compare it with a brute-force {id: distance}."""
+    assert {person['id'] for person in found} == set(expected)
+    for person in found:
+        assert person['distance_km'] == pytest.approx(expected[person['id']], abs=0.006)
+    distances = [person['distance_km'] for person in found]
+    assert distances == sorted(distances)
+
+
+def nearby(client, lat, lon, radius_km, org='', stream=False):
+    url = f'/api/nearby?lat={lat}&lon={lon}&radius={radius_km}&organization={org}'
+    if stream:
+        response = client.get(url + '&stream=1')
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return client.get(url).get_json()
+
+
+def check_every_path(app, client):
+    for org in ('', 'acme', 'Globex'):
+        for lat, lon, radius_km in QUERIES:
+            expected = brute_force(app, lat, lon, radius_km, org)
+            assert_matches(nearby(client, lat, lon, radius_km, org), expected)
+            assert_matches(nearby(client, lat, lon, radius_km, org, stream=True), expected)
+
+        queries = [{'lat': lat, 'lon': lon, 'radius': radius_km, 'organization': org} for lat, lon, radius_km in QUERIES]
+        queries += [{'lat': lat, 'lon': lon, 'k': 5, 'organization': org} for lat, lon, _ in QUERIES]
+        queries += [{'lat': lat, 'lon': lon, 'radius': radius_km, 'k': 3, 'organization': org}
+                    for lat, lon, radius_km in QUERIES]
+        results = client.post('/api/nearby/batch', json={'queries': queries}).get_json()['results']
+        for query, found in zip(queries, results):
+            everyone = brute_force(app, query['lat'], query['lon'], query.get('radius', float('inf')), org)
+            expected = dict(sorted(everyone.items(), key=lambda item: item[1])[:query.get('k')])
+            assert_matches(found, expected)
+
+
+@pytest.mark.parametrize('precision', [0, 2, 4])
+def test_nearby_matches_a_brute_force_scan(app, directory, client, monkeypatch, precision):
+    monkeypatch.setattr(app, 'NEARBY_GEOHASH_PRECISION', precision)
+    check_every_path(app, client)
+    # Queried again: served from the geohash cache and the already built grids
+    check_every_path(app, client)
+    # Includes the people at exactly 0.0, but not the ones without valid coordinates
+    assert {'401', '402'} <= {person['id'] for person in nearby(client, 0.0, 0.0, 100)}
+    assert app._snapshot.geo_missing == 1 and app._snapshot.geo_rejected == 1
+
+
+def test_nearby_matches_after_write_through(app, directory, client, monkeypatch):
+    monkeypatch.setattr(app, 'NEARBY_GEOHASH_PRECISION', 3)
+    rnd = directory
+    check_every_path(app, client)  # builds the grids, so they have to be kept up to date in place
+
+    for person_id in range(500, 560):
+        app.apply_submitted_row(random_row(rnd, person_id))
+    app.apply_submitted_row(person_row(560, organization='Globex', latitude='0.0', longitude='0.0'))
+    for person_id in rnd.sample(range(1, 401), 80):
+        # Moves, organization changes and swap-removals from the partitions
+        app.apply_updated_row(random_row(rnd, person_id))
+    for person_id in (2, 3, 4):
+        app.apply_updated_row(person_row(person_id, latitude='', longitude=''))
+    app.apply_updated_row(person_row(403, organization='Initech', latitude='51.5', longitude='-0.1'))
+
+    check_every_path(app, client)
@@ -0,0 +1,53 @@
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def reject_rows(sheet, marker, status=400):
+    """Make the fake sheet refuse any append containing a cell equal to marker."""
+    append = sheet.values_api.append
+
+    def guarded_append(spreadsheetId, range, body, **kwargs):
+        if any(marker in row for row in body['values']):
+            raise HttpError(httplib2.Response({'status': status}), b'{"error": {"message": "rejected"}}')
+        return append(spreadsheetId=spreadsheetId, range=range, body=body, **kwargs)
+    sheet.values_api.append = guarded_append
+
+
+def test_rejected_row_is_dead_lettered_without_blocking_the_queue(app, sheet):
+    reject_rows(sheet, 'Bad Row')
+    rows = [app.submission_row(100 + i, {'name': 'Bad Row' if i == 5 else f'Good {i}',
+                                         'email': f'q{i}@example.com', 'organization': 'Acme'})
+            for i in range(12)]
+    app.sheet_queue.enqueue(rows)
+
+    assert app.flush_sheet_queue() == 0
+
+    assert [row[0] for row in sheet.rows[5:]] == [str(100 + i) for i in range(12) if i != 5]
+    dead = app.sheet_queue.dead_letters()
+    assert [(op, row[0]) for _, op, row, _, _ in dead] == [('append', '105')]
+    stats = app.sheet_queue.stats()
+    assert stats['depth'] == 0
+    assert stats['dead_letters'] == 1
+
+
+def test_failing_rows_are_dead_lettered_after_max_attempts(app, sheet, monkeypatch):
+    monkeypatch.setattr(app, 'SHEETS_MAX_RETRIES', 0)
+    monkeypatch.setattr(app, 'SHEET_MAX_ATTEMPTS', 3)
+    reject_rows(sheet, 'Stuck', status=403)
+    app.sheet_queue.enqueue([app.submission_row(200, {'name': 'Stuck', 'email': 's@example.com',
+                                                      'organization': 'Acme'})])
+
+    assert app.flush_sheet_queue() > 0
+    assert app.flush_sheet_queue() > 0
+    assert app.sheet_queue.stats()['depth'] == 1
+    assert app.flush_sheet_queue() == 0
+
+    (dead,) = app.sheet_queue.dead_letters()
+    assert dead[3] == 3
+    assert app.sheet_queue.stats()['depth'] == 0
+
+
+def test_oversized_cells_are_refused_at_submit(client, sheet, app):
+    response = client.post('/api/submit', json={'name': 'x' * (app.SHEETS_CELL_MAX_CHARS + 1),
+                                               'email': 'long@example.com', 'organization': 'Acme'})
+    assert response.status_code == 400
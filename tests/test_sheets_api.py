@@ -0,0 +1,117 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httplib2
+import pytest
+from google.auth.exceptions import TransportError
+from googleapiclient.errors import HttpError
+
+
+class Flaky:
+    """A request factory whose first calls fail with the given errors, then succeed."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        return self
+
+    def execute(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'ok': True}
+
+
+def http_error(status, headers=None):
+    return HttpError(httplib2.Response(dict(headers or {}, status=status)), b'{}')
+
+
+@pytest.fixture
+def no_sleep(app, monkeypatch):
+    """Record the test's own sleeps instead of sleeping; time.sleep is shared with other threads."""
+    sleeps = []
+    test_thread = threading.current_thread()
+
+    def sleep(seconds):
+        if threading.current_thread() is test_thread:
+            sleeps.append(seconds)
+    monkeypatch.setattr(app.time, 'sleep', sleep)
+    return sleeps
+
+
+def test_retry_after_accepts_seconds_and_http_dates(app):
+    assert app.retry_after_seconds('7') == 7
+    assert app.retry_after_seconds(None) == 0
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < app.retry_after_seconds(later) <= 30
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=30), usegmt=True)
+    assert app.retry_after_seconds(earlier) == 0
+    assert app.retry_after_seconds('soon') == 0
+
+
+def test_429_with_an_http_date_is_retried(app, no_sleep):
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=5), usegmt=True)
+    request = Flaky(http_error(429, {'retry-after': later}))
+
+    assert app.execute_sheets_request(request, app.PRIORITY_READ) == {'ok': True}
+    assert request.calls == 2
+    assert no_sleep and no_sleep[0] > 3
+
+
+@pytest.mark.parametrize('error', [
+    httplib2.ServerNotFoundError('Unable to find the server at sheets.googleapis.com'),
+    TransportError('token endpoint unreachable'),
+    ConnectionResetError(),
+])
+def test_transport_errors_are_retried_and_counted(app, no_sleep, monkeypatch, error):
+    monkeypatch.setattr(app, 'sheets_stats', {'calls': 0, 'retries': 0, 'errors': 0})
+    request = Flaky(error)
+
+    assert app.execute_sheets_request(request, app.PRIORITY_READ) == {'ok': True}
+    assert request.calls == 2
+    assert app.sheets_stats['retries'] == 1
+
+
+@pytest.mark.parametrize('error', [
+    httplib2.ServerNotFoundError('Unable to find the server at sheets.googleapis.com'),
+    RuntimeError('unexpected'),
+])
+def test_a_failed_half_open_probe_does_not_wedge_the_breaker(app, no_sleep, monkeypatch, error):
+    breaker = app.CircuitBreaker(threshold=1, reset_timeout=0)
+    monkeypatch.setattr(app, 'sheets_breaker', breaker)
+    monkeypatch.setattr(app, 'SHEETS_MAX_RETRIES', 0)
+
+    with pytest.raises(ConnectionResetError):
+        app.execute_sheets_request(Flaky(ConnectionResetError()), app.PRIORITY_READ)
+    assert breaker.state == 'open'
+
+    # The half-open probe fails with something other than an HttpError
+    with pytest.raises(type(error)):
+        app.execute_sheets_request(Flaky(error), app.PRIORITY_READ)
+    assert breaker.state == 'open'
+    assert not breaker._probing
+
+    for _ in range(3):
+        assert app.execute_sheets_request(Flaky(), app.PRIORITY_READ) == {'ok': True}
+    assert breaker.state == 'closed'
+
+
+@pytest.mark.parametrize('path', ['/api/search?q=person', '/api/nearby?lat=1.5&lon=2.5', '/api/organizations',
+                                  '/api/export', '/api/check_profile_exists?email=person1@example.com'])
+def test_reads_never_wait_on_a_stale_snapshot_refresh(app, sheet, client, monkeypatch, path):
+    snapshot = app.get_people_snapshot()
+    monkeypatch.setattr(snapshot, '_loaded_monotonic', snapshot._loaded_monotonic - app.PEOPLE_CACHE_TTL - 1)
+    monkeypatch.setattr(app, '_refresh_in_flight', False)
+    refreshes = []
+    monkeypatch.setattr(app.socketio, 'start_background_task', lambda task, *args: refreshes.append(task))
+    # Sheets is down: anything that reached it on the request path would fail the test
+    monkeypatch.setattr(sheet.values_api, 'get', None)
+
+    response = client.get(path)
+
+    assert response.status_code == 200
+    assert app._snapshot is snapshot
+    assert len(refreshes) == 1
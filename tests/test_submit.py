@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def submit_all(app, payloads):
+    """POST every payload to /api/submit at once, one test client per request."""
+    def submit(payload):
+        response = app.app.test_client().post('/api/submit', json=payload)
+        return response.status_code, response.get_json()
+
+    with ThreadPoolExecutor(max_workers=len(payloads)) as pool:
+        return list(pool.map(submit, payloads))
+
+
+def test_parallel_submissions_get_distinct_ids(app, sheet):
+    payloads = [{'name': f'New {i}', 'email': f'new{i}@example.com', 'organization': 'Acme'}
+                for i in range(40)]
+
+    results = submit_all(app, payloads)
+
+    assert [status for status, _ in results] == [202] * 40
+    ids = [int(body['id']) for _, body in results]
+    assert len(set(ids)) == 40
+    assert min(ids) > 5  # after the people already in the sheet
+
+    assert app.flush_sheet_queue() == 0
+    sheet_ids = [row[0] for row in sheet.rows]
+    assert len(sheet_ids) == 45
+    assert len(set(sheet_ids)) == 45
+
+
+def test_submissions_append_without_reading_the_directory(app, sheet):
+    submit_all(app, [{'name': f'New {i}', 'email': f'new{i}@example.com', 'organization': 'Acme'}
+                     for i in range(10)])
+    app.flush_sheet_queue()
+
+    full_reads = [call for call in sheet.calls if call == ('get', app.RANGE_NAME)]
+    assert len(full_reads) == 1  # the cold-start snapshot, not one per submission
+    assert sum(rows for op, rows in sheet.calls if op == 'append') == 10
+
+
+def test_parallel_submissions_for_one_email_collapse_to_one_row(app, sheet):
+    payloads = [{'name': f'Version {i}', 'email': 'Same@Example.com', 'organization': 'Acme'}
+                for i in range(20)]
+
+    results = submit_all(app, payloads)
+
+    assert {status for status, _ in results} == {202}
+    assert len({body['id'] for _, body in results}) == 1
+    assert sum(1 for _, body in results if not body.get('updated')) == 1
+
+    app.flush_sheet_queue()
+    rows = [row for row in sheet.rows if row[4].lower() == 'same@example.com']
+    assert len(rows) == 1
+
+
+def test_submission_rows_hold_text(app):
+    row = app.submission_row(7, {'name': 'Seven', 'email': 't@x.com', 'organization': 'Acme', 'latitude': 1.5})
+    assert row == ['7', 'Seven', '', '', 't@x.com', '1.5', '', 'Acme', '']
+
+
+def test_non_text_fields_are_rejected_before_anything_is_queued(app, sheet, client):
+    response = client.post('/api/submit', json={'name': 5, 'email': 't@x.com', 'organization': 'Acme'})
+
+    assert response.status_code == 400
+    assert app.sheet_queue.pending_writes() == []
+    assert client.get('/api/search?q=acme').status_code == 200
+
+
+def test_a_person_that_cannot_be_indexed_leaves_the_snapshot_alone(app, sheet, client):
+    snapshot = app.get_people_snapshot()
+    people = len(snapshot.people)
+    person = app.parse_person_row(['99', 5, '', '', 'odd@example.com', '', '', 'Acme', ''])
+
+    with pytest.raises(AttributeError):
+        snapshot.add_person(person)
+
+    assert len(snapshot.people) == len(snapshot.search_text) == people
+    assert 'odd@example.com' not in snapshot.email_index
+    assert client.get('/api/search?q=person').status_code == 200